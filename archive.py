@@ -0,0 +1,368 @@
+"""Arsip massal stories dan highlights tanpa Telegram.
+
+Membaca daftar username (satu per baris, boleh URL profil atau @username,
+baris "#" diabaikan) lalu mengunduh semua story dan item highlight ke folder
+keluaran:
+
+    python archive.py accounts.txt --output archive --concurrency 4 --budget 5000
+
+    archive/media/<sha256[:2]>/<sha256>.<ext>      isi file, dialamatkan per isi (duplikat disimpan sekali)
+    archive/metadata/<username>/<mediaid>.json     metadata item dan hash isinya
+    archive/manifest.sqlite3                       item yang sudah diarsipkan; run berikutnya melewatinya
+    archive/reports/<waktu>.json                   laporan per akun
+"""
+import argparse
+import asyncio
+import copy
+import datetime
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from instaloader import Profile
+from utils.async_client import AsyncInstagramClient
+from utils.checkpoint_store import CheckpointStore
+from utils.http_utils import MediaTooLargeError
+from utils.instagram_utils import InstagramClient
+from utils.logging_utils import setup_logging, configure_logging, stop_logging
+
+logger = setup_logging()
+
+REQUIRED_ENV_VARS = ['INSTAGRAM_USERNAME', 'INSTAGRAM_PASSWORD']
+USERNAME_PATTERN = re.compile(r"(?:https?://)?(?:www\.)?(?:instagram\.com/)?@?([A-Za-z0-9_.]{1,30})/?", re.IGNORECASE)
+MANIFEST_JOB = "archive"
+
+class BudgetExhaustedError(RuntimeError):
+    """Dilempar saat jatah request bersama untuk satu run sudah habis."""
+
+class RequestBudget:
+    """Jatah request Instagram (API dan CDN) yang dibagi semua akun dalam satu run."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def take(self, count: int = 1):
+        if self.limit and self.used + count > self.limit:
+            raise BudgetExhaustedError(f"Request budget of {self.limit} exhausted")
+        self.used += count
+
+class AccountReport:
+    def __init__(self, username: str):
+        self.username = username
+        self.stories = 0
+        self.highlights = 0
+        self.archived = 0
+        self.skipped = 0
+        self.bytes_written = 0
+        self.failures: List[str] = []
+        self.status = "pending"
+        self.seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__)
+
+def read_usernames(path: str) -> List[str]:
+    usernames, seen = [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            match = USERNAME_PATTERN.fullmatch(line)
+            if not match:
+                logger.warning("Ignoring invalid account line: %s", line)
+                continue
+            username = match.group(1)
+            if username.lower() not in seen:
+                seen.add(username.lower())
+                usernames.append(username)
+    return usernames
+
+def write_atomic(path: str, data: bytes):
+    """Tulis lewat file sementara unik agar file setengah jadi tidak pernah terlihat di arsip."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+
+class Archiver:
+    """Pipeline arsip: profil -> stories (satu query per batch akun) -> highlights -> unduhan media."""
+
+    def __init__(self, client: AsyncInstagramClient, output: str, budget: RequestBudget,
+                 concurrency: int = 4, downloads: int = 8, stories_batch: int = 20,
+                 include_stories: bool = True, include_highlights: bool = True, chunk_size: int = 10):
+        self.client = client
+        self.output = output
+        self.budget = budget
+        self.concurrency = concurrency
+        self.stories_batch = stories_batch
+        self.include_stories = include_stories
+        self.include_highlights = include_highlights
+        self.chunk_size = chunk_size
+        self.manifest = CheckpointStore(os.path.join(output, "manifest.sqlite3"), ttl=0)
+        self._downloads = asyncio.Semaphore(downloads)
+
+    def media_path(self, digest: str, is_video: bool) -> str:
+        return os.path.join(self.output, "media", digest[:2], f"{digest}.{'mp4' if is_video else 'jpg'}")
+
+    async def archive_item(self, item, profile: Profile, report: AccountReport, archived: set,
+                           highlight=None):
+        if str(item.mediaid) in archived:
+            report.skipped += 1
+            return
+        async with self._downloads:
+            self.budget.take()
+            try:
+                data = await self.client.fetch_media(item)
+            except MediaTooLargeError as e:
+                report.failures.append(f"{item.mediaid}: {e}")
+                return
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.media_path(digest, item.is_video)
+        if not os.path.exists(path):
+            await asyncio.to_thread(write_atomic, path, data)
+            report.bytes_written += len(data)
+        metadata = {
+            "mediaid": item.mediaid,
+            "username": profile.username,
+            "owner_id": profile.userid,
+            "source": "highlight" if highlight is not None else "story",
+            "highlight": {"id": highlight.unique_id, "title": highlight.title} if highlight is not None else None,
+            "date_utc": item.date_utc.isoformat(),
+            "is_video": item.is_video,
+            "typename": getattr(item, "typename", None),
+            "sha256": digest,
+            "size": len(data),
+            "media_path": os.path.relpath(path, self.output),
+            "archived_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        }
+        metadata_path = os.path.join(self.output, "metadata", profile.username.lower(), f"{item.mediaid}.json")
+        await asyncio.to_thread(write_atomic, metadata_path, json.dumps(metadata, indent=2).encode("utf-8"))
+        report.bytes_written += os.path.getsize(metadata_path)
+        await asyncio.to_thread(self.manifest.mark, profile.userid, MANIFEST_JOB, [item.mediaid])
+        archived.add(str(item.mediaid))
+        report.archived += 1
+
+    async def archive_items(self, items: List, profile: Profile, report: AccountReport, archived: set,
+                            highlight=None):
+        results = await asyncio.gather(
+            *(self.archive_item(item, profile, report, archived, highlight) for item in items),
+            return_exceptions=True
+        )
+        for item, result in zip(items, results):
+            if isinstance(result, BudgetExhaustedError):
+                raise result
+            if isinstance(result, Exception):
+                logger.warning("Archiving item %s of %s failed: %s", item.mediaid, profile.username, result)
+                report.failures.append(f"{item.mediaid}: {result}")
+
+    async def archive_highlights(self, profile: Profile, report: AccountReport, archived: set):
+        self.budget.take()
+        highlights = await self.client.get_highlights(profile)
+        report.highlights = len(highlights)
+        for highlight in highlights:
+            chunk: List = []
+            self.budget.take()  # Satu request: instaloader mengambil semua item saat iterator dibuka
+            async for item in self.client.stream_highlight_items(highlight, self.chunk_size):
+                chunk.append(item)
+                if len(chunk) >= self.chunk_size:
+                    await self.archive_items(chunk, profile, report, archived, highlight)
+                    chunk = []
+            if chunk:
+                await self.archive_items(chunk, profile, report, archived, highlight)
+
+    async def resolve_profiles(self, reports: Dict[str, AccountReport]) -> List[Tuple[str, Profile]]:
+        """Pasangan (username di daftar, profil) untuk akun yang bisa diarsipkan."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def resolve(username: str) -> Optional[Profile]:
+            report = reports[username]
+            async with semaphore:
+                try:
+                    self.budget.take()
+                    profile = await self.client.get_profile(username)
+                except BudgetExhaustedError:
+                    report.status = "budget_exhausted"
+                    return None
+                except Exception as e:
+                    report.status = "failed"
+                    report.failures.append(f"profile: {e}")
+                    return None
+            if profile.is_private and not profile.followed_by_viewer:
+                report.status = "private"
+                return None
+            return profile
+
+        profiles = await asyncio.gather(*(resolve(username) for username in reports))
+        return [(username, profile) for username, profile in zip(reports, profiles) if profile is not None]
+
+    async def fetch_stories(self, accounts: List[Tuple[str, Profile]],
+                            reports: Dict[str, AccountReport]) -> Dict[int, List]:
+        """Stories semua akun, satu query reel per stories_batch akun."""
+        stories: Dict[int, List] = {}
+        if not self.include_stories:
+            return stories
+        for start in range(0, len(accounts), self.stories_batch):
+            batch = accounts[start:start + self.stories_batch]
+            try:
+                self.budget.take()
+                stories.update(await self.client.get_stories_by_user([profile.userid for _, profile in batch]))
+            except BudgetExhaustedError:
+                raise
+            except Exception as e:
+                logger.warning("Stories batch starting at %s failed: %s", batch[0][0], e)
+                for username, _ in batch:
+                    reports[username].failures.append(f"stories: {e}")
+        return stories
+
+    async def archive_account(self, profile: Profile, stories: List, report: AccountReport):
+        started = time.perf_counter()
+        archived = await asyncio.to_thread(self.manifest.delivered, profile.userid, MANIFEST_JOB)
+        try:
+            report.stories = len(stories)
+            await self.archive_items(stories, profile, report, archived)
+            if self.include_highlights:
+                await self.archive_highlights(profile, report, archived)
+            report.status = "partial" if report.failures else "ok"
+        except BudgetExhaustedError:
+            report.status = "budget_exhausted"
+        except Exception as e:
+            logger.error("Archiving %s failed: %s", profile.username, e)
+            report.status = "failed"
+            report.failures.append(str(e))
+        report.seconds = round(time.perf_counter() - started, 3)
+        logger.info(
+            "Archived %s: %s new, %s skipped, %s failures", profile.username, report.archived, report.skipped,
+            len(report.failures)
+        )
+
+    async def run(self, usernames: List[str]) -> Dict[str, AccountReport]:
+        reports = {username: AccountReport(username) for username in usernames}
+        accounts = await self.resolve_profiles(reports)
+        try:
+            stories = await self.fetch_stories(accounts, reports)
+        except BudgetExhaustedError:
+            for username, _ in accounts:
+                reports[username].status = "budget_exhausted"
+            return reports
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_account(username: str, profile: Profile):
+            async with semaphore:
+                if self.budget.limit and self.budget.used >= self.budget.limit:
+                    reports[username].status = "budget_exhausted"
+                    return
+                await self.archive_account(profile, stories.get(profile.userid, []), reports[username])
+
+        await asyncio.gather(*(run_account(username, profile) for username, profile in accounts))
+        return reports
+
+def build_report(reports: Dict[str, AccountReport], budget: RequestBudget, elapsed: float) -> dict:
+    archived = sum(report.archived for report in reports.values())
+    written = sum(report.bytes_written for report in reports.values())
+    return {
+        "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "seconds": round(elapsed, 3),
+        "accounts": len(reports),
+        "items_archived": archived,
+        "items_skipped": sum(report.skipped for report in reports.values()),
+        "bytes_written": written,
+        "items_per_second": round(archived / elapsed, 2) if elapsed else 0.0,
+        "mb_per_second": round(written / 1024 / 1024 / elapsed, 2) if elapsed else 0.0,
+        "requests_used": budget.used,
+        "request_budget": budget.limit,
+        "per_account": [report.as_dict() for report in reports.values()],
+    }
+
+def print_report(report: dict):
+    print(f"Archived {report['items_archived']} items from {report['accounts']} accounts "
+          f"in {report['seconds']}s ({report['items_per_second']} items/s, {report['mb_per_second']} MB/s)")
+    print(f"Skipped {report['items_skipped']} already archived, wrote {report['bytes_written'] / 1024 / 1024:.1f} MB, "
+          f"used {report['requests_used']}/{report['request_budget'] or 'unlimited'} requests")
+    for account in report["per_account"]:
+        line = (f"  {account['username']:<30} {account['status']:<17} new={account['archived']:<5} "
+                f"skipped={account['skipped']:<5} bytes={account['bytes_written']:<11} failures={len(account['failures'])}")
+        print(line)
+        for failure in account["failures"][:3]:
+            print(f"      {failure}")
+
+def load_config(path: str, args) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        config = copy.deepcopy(json.load(f))
+    archive_config = config.get("archive", {})
+    # Batas ukuran Telegram tidak berlaku untuk arsip; prefetch dan metrics milik bot tidak dipakai
+    config["max_file_size_mb"] = archive_config.get("max_file_size_mb", 1024)
+    config["prefetch"] = {"enabled": False}
+    config["metrics"] = {"enabled": False}
+    if args.workers:
+        config.setdefault("executor", {})["max_workers"] = args.workers
+    return config
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archive stories and highlights of many Instagram accounts")
+    parser.add_argument("accounts", help="file with one username, @handle or profile URL per line")
+    parser.add_argument("--output", default=None, help="archive directory (default: archive.output from config)")
+    parser.add_argument("--config", default="config/config.json")
+    parser.add_argument("--concurrency", type=int, default=None, help="accounts processed at the same time")
+    parser.add_argument("--downloads", type=int, default=None, help="media downloads at the same time")
+    parser.add_argument("--budget", type=int, default=None, help="max Instagram requests for the run (0 = unlimited)")
+    parser.add_argument("--workers", type=int, default=0, help="override executor.max_workers")
+    parser.add_argument("--no-stories", action="store_true")
+    parser.add_argument("--no-highlights", action="store_true")
+    return parser.parse_args(argv)
+
+async def run_archive(args, config: dict, instagram: InstagramClient) -> dict:
+    archive_config = config.get("archive", {})
+    client = AsyncInstagramClient(instagram, config)
+    budget = RequestBudget(args.budget if args.budget is not None else archive_config.get("request_budget", 5000))
+    output = args.output or archive_config.get("output", "archive")
+    archiver = Archiver(
+        client, output, budget,
+        concurrency=args.concurrency or archive_config.get("concurrency", 4),
+        downloads=args.downloads or archive_config.get("downloads", 8),
+        stories_batch=archive_config.get("stories_batch", 20),
+        include_stories=not args.no_stories,
+        include_highlights=not args.no_highlights,
+        chunk_size=config.get("delivery", {}).get("stream_chunk", 5)
+    )
+    usernames = read_usernames(args.accounts)
+    logger.info("Archiving %s accounts into %s with a budget of %s requests", len(usernames), output, budget.limit)
+    started = time.perf_counter()
+    client.start_background()
+    try:
+        reports = await archiver.run(usernames)
+    finally:
+        await client.shutdown()
+    report = build_report(reports, budget, time.perf_counter() - started)
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    report_path = os.path.join(output, "reports", f"{stamp}.json")
+    write_atomic(report_path, json.dumps(report, indent=2).encode("utf-8"))
+    logger.info("Archive report saved to %s", report_path)
+    return report
+
+def main(argv=None):
+    args = parse_args(argv)
+    load_dotenv()
+    config = load_config(args.config, args)
+    configure_logging(config)
+    env_vars = {var: os.getenv(var).strip('"').strip("'") if os.getenv(var) else None for var in REQUIRED_ENV_VARS}
+    missing = [var for var, value in env_vars.items() if value is None]
+    if missing:
+        logger.error("Missing .env variables: %s", ', '.join(missing))
+        sys.exit(1)
+    report = asyncio.run(run_archive(args, config, InstagramClient(env_vars, config)))
+    print_report(report)
+    stop_logging()
+    failed = [account for account in report["per_account"] if account["status"] == "failed"]
+    sys.exit(1 if failed and len(failed) == len(report["per_account"]) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import email.parser
+import email.policy
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+class FakeBotServer:
+    """Server HTTP lokal pengganti api.telegram.org; mencatat setiap panggilan Bot API.
+
+    Dipakai lewat config telegram_base_url (nilai base_url), sehingga Application dan Bot asli
+    dari python-telegram-bot bisa diuji dari ujung ke ujung, termasuk mode webhook.
+    """
+
+    def __init__(self, host: str = "127.0.0.1"):
+        self.calls: List[Tuple[str, dict]] = []
+        self.uploaded_bytes = 0
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                method = self.path.rstrip("/").rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length", 0))
+                params, uploaded = parse_params(self.headers.get("Content-Type", ""), self.rfile.read(length))
+                with server._lock:
+                    server.calls.append((method, params))
+                    server.uploaded_bytes += uploaded
+                body = json.dumps({"ok": True, "result": server.result(method, params)}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}/bot"
+        threading.Thread(target=self.server.serve_forever, name="fake-bot-api", daemon=True).start()
+
+    def message(self, params: dict, kind: Optional[str] = None) -> dict:
+        message_id = next(self._message_ids)
+        chat_id = int(params.get("chat_id", 0))
+        message = {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+        file = {"file_id": f"{kind}-{message_id}", "file_unique_id": f"u{message_id}"}
+        if kind == "photo":
+            message["photo"] = [dict(file, width=1080, height=1920)]
+        elif kind == "video":
+            message["video"] = dict(file, width=1080, height=1920, duration=5)
+        elif kind == "document":
+            message["document"] = file
+        else:
+            message["text"] = params.get("text", "")
+        return message
+
+    def result(self, method: str, params: dict):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method in ("sendPhoto", "sendVideo", "sendDocument"):
+            return self.message(params, method[len("send"):].lower())
+        if method == "sendMediaGroup":
+            return [self.message(params, entry.get("type")) for entry in json.loads(params.get("media", "[]"))]
+        if method in ("sendMessage", "editMessageText"):
+            return self.message(params)
+        return True  # setWebhook, answerCallbackQuery, deleteMessage, dll
+
+    def calls_to(self, method: str, predicate: Optional[Callable[[dict], bool]] = None) -> List[dict]:
+        with self._lock:
+            return [params for name, params in self.calls
+                    if name == method and (predicate is None or predicate(params))]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for name, _ in self.calls:
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def parse_params(content_type: str, body: bytes) -> Tuple[dict, int]:
+    """Parameter Bot API dari body form/multipart; isi file diganti ukurannya saja."""
+    if content_type.startswith("multipart/form-data"):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+        )
+        params, uploaded = {}, 0
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                uploaded += len(payload)
+                params[name] = f"<{len(payload)} bytes>"
+            else:
+                params[name] = payload.decode("utf-8")
+        return params, uploaded
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}"), 0
+    return dict(parse_qsl(body.decode("utf-8"))), 0
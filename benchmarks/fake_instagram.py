@@ -0,0 +1,243 @@
+import asyncio
+import datetime
+import os
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from utils.instagram_utils import InstagramClient
+
+EPOCH = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+class FakeCDN:
+    """Server HTTP lokal pengganti CDN Instagram; isi file sintetis sebesar angka di awal path."""
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1"):
+        self.latency = latency
+        self.requests = 0
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        self._payloads: Dict[int, bytes] = {}
+        cdn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, seperti CDN sungguhan
+
+            def do_GET(self):
+                try:
+                    size = int(self.path.lstrip("/").split("/", 1)[0])
+                except ValueError:
+                    self.send_error(404)
+                    return
+                if cdn.latency:
+                    time.sleep(cdn.latency)
+                # Isi sintetis hanya bergantung pada path, jadi path sekaligus menjadi ETag
+                etag = f'"{self.path.split("?", 1)[0]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    with cdn._lock:
+                        cdn.requests += 1
+                    return
+                body = cdn.payload(size)
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4" if self.path.endswith(".mp4") else "image/jpeg")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    return  # Klien membatalkan unduhan (batas ukuran atau deadline)
+                with cdn._lock:
+                    cdn.requests += 1
+                    cdn.bytes_served += size
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, 0), Handler)
+        self.server.daemon_threads = True
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, name="fake-cdn", daemon=True).start()
+
+    def payload(self, size: int) -> bytes:
+        body = self._payloads.get(size)
+        if body is None:
+            body = self._payloads[size] = os.urandom(min(size, 4096)) * (size // 4096) + os.urandom(size % 4096)
+        return body
+
+    def url(self, size: int, name: str) -> str:
+        return f"{self.base_url}/{size}/{name}"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class FakeStoryItem:
+    """Meniru atribut StoryItem instaloader yang dipakai bot."""
+
+    def __init__(self, mediaid: int, owner_id: int, is_video: bool, date_utc: datetime.datetime,
+                 cdn: FakeCDN, size: int):
+        self.mediaid = mediaid
+        self.owner_id = owner_id
+        self.is_video = is_video
+        self.date_utc = date_utc
+        self.typename = "GraphStoryVideo" if is_video else "GraphStoryImage"
+        self.size = size
+        self.url = cdn.url(size if not is_video else 64 * 1024, f"{mediaid}.jpg")
+        self.video_url = cdn.url(size, f"{mediaid}.mp4") if is_video else None
+        # Varian video seperti di node GraphQL: resolusi penuh dan versi yang lebih kecil
+        self._node = {"video_resources": [
+            {"src": cdn.url(max(1, size // 4), f"{mediaid}_480.mp4"), "config_width": 480, "config_height": 854},
+            {"src": self.video_url, "config_width": 720, "config_height": 1280},
+        ]} if is_video else {}
+
+class FakeHighlight:
+    def __init__(self, unique_id: int, owner_id: int, title: str, items: List[FakeStoryItem], loader: "FakeInstaloader"):
+        self.unique_id = unique_id
+        self.owner_id = owner_id
+        self.title = title
+        self._items = items
+        self._loader = loader
+        self._fetched = False
+
+    def _fetch_items(self):
+        # Seperti instaloader: satu request saat pertama kali dibutuhkan, lalu disimpan di objek
+        if not self._fetched:
+            self._loader.api_call("highlight_items")
+            self._fetched = True
+
+    @property
+    def itemcount(self) -> int:
+        self._fetch_items()
+        return len(self._items)
+
+    def get_items(self):
+        self._fetch_items()
+        return iter(self._items)
+
+class FakeStory:
+    def __init__(self, owner_id: int, items: List[FakeStoryItem]):
+        self.owner_id = owner_id
+        self._items = items
+
+    def get_items(self):
+        return iter(self._items)
+
+class FakeProfile:
+    def __init__(self, username: str, userid: int, profile_pic_url: str, loader: "FakeInstaloader"):
+        self.username = username
+        self.userid = userid
+        self.full_name = username.replace("_", " ").title()
+        self.biography = "Synthetic profile for benchmarks"
+        self.is_private = False
+        self.followed_by_viewer = True
+        self.is_verified = userid % 7 == 0
+        self.is_business_account = userid % 5 == 0
+        self.followers = userid * 13 % 1000000
+        self.followees = userid % 1000
+        self.mediacount = userid % 500
+        self._profile_pic_url = profile_pic_url
+        self._loader = loader
+        self._iphone_fetched = False
+
+    @property
+    def profile_pic_url(self) -> str:
+        # Sesi login: instaloader mengambil URL HD lewat api/v1/users/{id}/info/ (satu request)
+        if not self._iphone_fetched:
+            self._loader.api_call("profile_pic_url")
+            self._iphone_fetched = True
+        return self._profile_pic_url
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+class FakeContext:
+    """Cukup untuk InstagramClient.validate_session; login diatur BenchInstagramClient."""
+
+    def __init__(self):
+        self.is_logged_in = False
+
+class FakeInstaloader:
+    """Pengganti Instaloader: profil, stories dan highlights deterministik dengan latensi API buatan."""
+
+    def __init__(self, cdn: FakeCDN, api_latency: float = 0.0, stories_per_profile: int = 5,
+                 highlights_per_profile: int = 12, items_per_highlight: int = 8, video_ratio: float = 0.3,
+                 photo_size: int = 150 * 1024, video_size: int = 2 * 1024 * 1024):
+        self.cdn = cdn
+        self.context = FakeContext()
+        self.api_latency = api_latency
+        self.stories_per_profile = stories_per_profile
+        self.highlights_per_profile = highlights_per_profile
+        self.items_per_highlight = items_per_highlight
+        self.video_ratio = video_ratio
+        self.photo_size = photo_size
+        self.video_size = video_size
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def api_call(self, name: str):
+        if on_event_loop():
+            # Instaloader sungguhan akan menahan seluruh event loop di sini
+            raise RuntimeError(f"Blocking Instagram call '{name}' made on the event loop")
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        if self.api_latency:
+            time.sleep(self.api_latency)
+
+    @staticmethod
+    def userid_for(username: str) -> int:
+        return zlib.crc32(username.lower().encode("utf-8")) % 10 ** 9 + 1
+
+    def make_item(self, mediaid: int, owner_id: int, index: int) -> FakeStoryItem:
+        # Pola video tetap per mediaid agar hasil antar run bisa dibandingkan
+        is_video = (mediaid * 2654435761 % 1000) < self.video_ratio * 1000
+        return FakeStoryItem(
+            mediaid, owner_id, is_video, EPOCH + datetime.timedelta(minutes=index),
+            self.cdn, self.video_size if is_video else self.photo_size
+        )
+
+    def profile(self, username: str) -> FakeProfile:
+        self.api_call("profile")
+        userid = self.userid_for(username)
+        return FakeProfile(username, userid, self.cdn.url(self.photo_size, f"s150x150/{userid}.jpg"), self)
+
+    def get_stories(self, userids: Optional[List[int]] = None):
+        self.api_call("stories")
+        for userid in userids or []:
+            yield FakeStory(userid, [
+                self.make_item(userid * 1000 + index, userid, index) for index in range(self.stories_per_profile)
+            ])
+
+    def get_highlights(self, user: FakeProfile):
+        self.api_call("highlights")
+        for number in range(1, self.highlights_per_profile + 1):
+            unique_id = user.userid * 100 + number
+            items = [
+                self.make_item(unique_id * 1000 + index, user.userid, index)
+                for index in range(self.items_per_highlight)
+            ]
+            yield FakeHighlight(unique_id, user.userid, f"Highlight {number}", items, self)
+
+    def download_storyitem(self, item: FakeStoryItem, target: str):
+        self.api_call("download")
+        extension = "mp4" if item.is_video else "jpg"
+        with open(os.path.join(target, f"{item.mediaid}.{extension}"), "wb") as f:
+            f.write(self.cdn.payload(item.size))
+
+class BenchInstagramClient(InstagramClient):
+    """InstagramClient asli (cache, governor, HTTP pool) di atas FakeInstaloader, tanpa login sungguhan."""
+
+    def login(self, force: bool = False):
+        self.loader.context.is_logged_in = True
+        self.session_health.mark_renewed()
+
+    def load_profile(self, username: str) -> FakeProfile:
+        return self.loader.profile(username)
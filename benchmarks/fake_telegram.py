@@ -0,0 +1,125 @@
+import asyncio
+import itertools
+import types
+from typing import List, Optional
+from telegram import InputFile, InputMediaVideo
+
+class FakeBotAPI:
+    """Pengganti Bot API Telegram: mencatat pesan dan meniru waktu upload (RTT + byte / bandwidth)."""
+
+    def __init__(self, latency: float = 0.05, upload_bytes_per_second: float = 10 * 1024 * 1024):
+        self.latency = latency
+        self.upload_bytes_per_second = upload_bytes_per_second
+        self.messages = 0
+        self.media_items = 0
+        self.uploaded_bytes = 0
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def payload_size(media) -> int:
+        if isinstance(media, bytes):
+            return len(media)
+        if isinstance(media, InputFile):
+            return len(media.input_file_content or b"")
+        if hasattr(media, "getbuffer"):
+            return media.getbuffer().nbytes
+        return 0  # file_id atau URL: Telegram tidak menerima isi file dari bot
+
+    async def call(self, uploaded: int = 0, media_items: int = 0):
+        self.messages += 1
+        self.media_items += media_items
+        self.uploaded_bytes += uploaded
+        await asyncio.sleep(self.latency + uploaded / self.upload_bytes_per_second)
+
+    def new_message(self, kind: Optional[str] = None):
+        message_id = next(self._message_ids)
+        file_id = f"{kind or 'text'}-{message_id}"
+        message = types.SimpleNamespace(message_id=message_id, photo=[], video=None, document=None)
+        if kind == "photo":
+            message.photo = [types.SimpleNamespace(file_id=file_id)]
+        elif kind in ("video", "document"):
+            setattr(message, kind, types.SimpleNamespace(file_id=file_id))
+        return message
+
+class FakeMessage:
+    def __init__(self, api: FakeBotAPI, chat: "FakeChat", text: Optional[str] = None):
+        self.api = api
+        self.chat = chat
+        self.text = text
+
+    async def reply_text(self, text: str, reply_markup=None, **kwargs):
+        await self.api.call()
+        self.chat.replies.append(("text", text, reply_markup))
+        return self.api.new_message()
+
+    async def _reply_media(self, kind: str, media, **kwargs):
+        await self.api.call(self.api.payload_size(media), media_items=1)
+        self.chat.replies.append((kind, kwargs.get("caption"), None))
+        self.chat.media_items += 1
+        return self.api.new_message(kind)
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self._reply_media("photo", photo, **kwargs)
+
+    async def reply_video(self, video, **kwargs):
+        return await self._reply_media("video", video, **kwargs)
+
+    async def reply_document(self, document, **kwargs):
+        return await self._reply_media("document", document, **kwargs)
+
+    async def reply_media_group(self, media: List, **kwargs):
+        uploaded = sum(self.api.payload_size(entry.media) for entry in media)
+        await self.api.call(uploaded, media_items=len(media))
+        self.chat.replies.append(("album", len(media), None))
+        self.chat.media_items += len(media)
+        return [
+            self.api.new_message("video" if isinstance(entry, InputMediaVideo) else "photo")
+            for entry in media
+        ]
+
+class FakeChat:
+    """Riwayat balasan satu pengguna simulasi."""
+
+    def __init__(self):
+        self.replies: List = []
+        self.media_items = 0
+
+    def last_keyboard(self) -> List[str]:
+        for kind, _, markup in reversed(self.replies):
+            if kind == "text" and markup is not None:
+                return [button.callback_data for row in markup.inline_keyboard for button in row]
+        return []
+
+    def last_text(self) -> Optional[str]:
+        for kind, text, _ in reversed(self.replies):
+            if kind in ("text", "edit"):
+                return text
+        return None
+
+class FakeCallbackQuery:
+    def __init__(self, api: FakeBotAPI, chat: FakeChat, user, data: str):
+        self.api = api
+        self.chat = chat
+        self.data = data
+        self.from_user = user
+        self.message = FakeMessage(api, chat)
+
+    async def answer(self, *args, **kwargs):
+        await self.api.call()
+
+    async def edit_message_text(self, text: str, reply_markup=None, **kwargs):
+        await self.api.call()
+        self.chat.replies.append(("edit", text, reply_markup))
+
+def make_user(user_id: int, language_code: str = "id"):
+    return types.SimpleNamespace(id=user_id, language_code=language_code)
+
+def message_update(api: FakeBotAPI, chat: FakeChat, user, text: str):
+    return types.SimpleNamespace(
+        effective_user=user, message=FakeMessage(api, chat, text), callback_query=None
+    )
+
+def callback_update(api: FakeBotAPI, chat: FakeChat, user, data: str):
+    return types.SimpleNamespace(
+        effective_user=user, message=None, callback_query=FakeCallbackQuery(api, chat, user, data)
+    )
@@ -0,0 +1,314 @@
+"""Benchmark end-to-end tanpa akun sungguhan.
+
+Menjalankan handle_message dan button_handler untuk banyak pengguna simulasi
+secara bersamaan, di atas FakeInstaloader, CDN lokal dan Bot API tiruan.
+
+    python -m benchmarks.run --users 50 --sessions 3
+
+Hasil disimpan sebagai JSON di benchmarks/results/ dan dibandingkan dengan
+hasil terakhir yang memakai parameter sama.
+"""
+import argparse
+import asyncio
+import copy
+import datetime
+import glob
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.fake_instagram import FakeCDN, FakeInstaloader, BenchInstagramClient
+from benchmarks.fake_telegram import FakeBotAPI, FakeChat, make_user, message_update, callback_update
+from handlers.telegram_handlers import handle_message, button_handler
+from utils.async_client import AsyncInstagramClient
+from utils.callback_utils import decode_callback, STORY, HIGHLIGHTS, HIGHLIGHT_ITEMS, PROFILE_INFO, PROFILE_PIC
+from utils.logging_utils import configure_logging, stop_logging
+from utils.metrics import REGISTRY
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+ACTIONS = {STORY: "story", PROFILE_INFO: "profile_info", PROFILE_PIC: "profile_pic", HIGHLIGHTS: "highlights"}
+
+def percentile(values: List[float], q: float) -> float:
+    """Persentil nearest-rank; 0 untuk daftar kosong."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4) if values else 0.0,
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss dalam KB di Linux, byte di macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+class PacingClock:
+    """Fungsi tidur pengganti untuk governor dan jitter: dicatat, lalu diskalakan (0 = tidak tidur)."""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.calls = 0
+        self.requested = 0.0
+        self.longest = 0.0
+
+    def record(self, seconds: float):
+        self.calls += 1
+        self.requested += seconds
+        self.longest = max(self.longest, seconds)
+
+    def sleep(self, seconds: float):
+        self.record(seconds)
+        if self.scale > 0:
+            time.sleep(seconds * self.scale)
+
+    async def async_sleep(self, seconds: float):
+        self.record(seconds)
+        if self.scale > 0:
+            await asyncio.sleep(seconds * self.scale)
+
+def build_config(args, workdir: str) -> dict:
+    with open(os.path.join(ROOT, "config", "config.json"), "r", encoding="utf-8") as f:
+        config = copy.deepcopy(json.load(f))
+    config["metrics"] = {"enabled": False}
+    config["file_id_cache"] = {"path": os.path.join(workdir, "file_ids.sqlite3"), "max_entries": 50000}
+    config.setdefault("state", {})["path"] = os.path.join(workdir, "state.sqlite3")
+    config.setdefault("checkpoints", {})["path"] = os.path.join(workdir, "checkpoints.sqlite3")
+    config.setdefault("watermarks", {})["path"] = os.path.join(workdir, "watermarks.sqlite3")
+    config.setdefault("profile_pic_cache", {})["path"] = os.path.join(workdir, "profile_pics.sqlite3")
+    config.setdefault("rate_limit", {})["dummy_visit_chance"] = 0
+    config.setdefault("executor", {})
+    if args.workers:
+        config["executor"]["max_workers"] = args.workers
+    if args.transport:
+        config.setdefault("delivery", {})["transport"] = args.transport
+    return config
+
+def profile_names(count: int) -> List[str]:
+    return [f"bench_profile_{index:04d}" for index in range(count)]
+
+async def simulate_user(user_id: int, args, config: dict, client: AsyncInstagramClient, api: FakeBotAPI,
+                        profiles: List[str], weights: List[float], samples: Dict[str, List[float]],
+                        outcome: Dict[str, int]):
+    rng = random.Random(args.seed * 100003 + user_id)
+    user = make_user(user_id)
+    languages = config["languages"][user.language_code]
+
+    async def timed_call(action: str, handler, update, chat: FakeChat):
+        start = time.perf_counter()
+        await handler(update, None, config, client)
+        samples.setdefault(action, []).append(time.perf_counter() - start)
+        outcome["requests"] += 1
+        text = chat.last_text()
+        if text == languages["busy"]:
+            outcome["busy"] += 1
+        elif text == languages["error"]:
+            outcome["errors"] += 1
+
+    for _ in range(args.sessions):
+        chat = FakeChat()
+        username = rng.choices(profiles, weights=weights)[0]
+        await timed_call("message", handle_message, message_update(
+            api, chat, user, f"https://www.instagram.com/{username}/"
+        ), chat)
+        menu = chat.last_keyboard()
+        for data in rng.sample(menu, len(menu)):
+            action, _, _ = decode_callback(data)
+            await timed_call(ACTIONS.get(action, action), button_handler, callback_update(api, chat, user, data), chat)
+            if action != HIGHLIGHTS:
+                continue
+            highlight_buttons = [
+                data for data in chat.last_keyboard() if decode_callback(data)[0] == HIGHLIGHT_ITEMS
+            ]
+            for data in rng.sample(highlight_buttons, min(args.highlight_picks, len(highlight_buttons))):
+                await timed_call("highlight_items", button_handler, callback_update(api, chat, user, data), chat)
+        if args.think_time:
+            await asyncio.sleep(rng.uniform(0, args.think_time))
+
+async def run_benchmark(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="instbot-bench-")
+    config = build_config(args, workdir)
+    cdn = FakeCDN(latency=args.cdn_latency_ms / 1000)
+    loader = FakeInstaloader(
+        cdn,
+        api_latency=args.ig_latency_ms / 1000,
+        stories_per_profile=args.stories,
+        highlights_per_profile=args.highlights,
+        items_per_highlight=args.highlight_items,
+        video_ratio=args.video_ratio,
+        photo_size=args.photo_kb * 1024,
+        video_size=args.video_kb * 1024
+    )
+    pacing = PacingClock(args.pacing_scale)
+    instagram = BenchInstagramClient(
+        {"INSTAGRAM_USERNAME": "bench", "INSTAGRAM_PASSWORD": "bench"}, config, loader=loader
+    )
+    instagram.governor.sleep = pacing.sleep
+    instagram.governor.async_sleep = pacing.async_sleep
+    client = AsyncInstagramClient(instagram, config)
+    api = FakeBotAPI(latency=args.tg_latency_ms / 1000, upload_bytes_per_second=args.tg_mbps * 1024 * 1024)
+
+    profiles = profile_names(args.profiles)
+    # Popularitas mirip Zipf: sebagian kecil profil menerima sebagian besar permintaan
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(len(profiles))]
+    samples: Dict[str, List[float]] = {}
+    outcome = {"requests": 0, "errors": 0, "busy": 0}
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            simulate_user(user_id, args, config, client, api, profiles, weights, samples, outcome)
+            for user_id in range(1, args.users + 1)
+        ))
+    finally:
+        wall = time.perf_counter() - start
+        await client.shutdown()
+        cdn.close()
+
+    all_samples = [value for values in samples.values() for value in values]
+    phases = {}
+    for name, series in REGISTRY.histograms.items():
+        for key, histogram in series.items():
+            label = ",".join(value for _, value in key) or "-"
+            phases[f"{name}[{label}]"] = {
+                "count": histogram.count,
+                "mean": round(histogram.total / histogram.count, 4) if histogram.count else 0.0,
+                "p95_bucket": histogram.quantile(0.95),
+            }
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "no_save", "log_level")},
+        "wall_seconds": round(wall, 3),
+        "requests": outcome["requests"],
+        "errors": outcome["errors"],
+        "busy": outcome["busy"],
+        "latency": summarize(all_samples),
+        "latency_by_action": {action: summarize(values) for action, values in sorted(samples.items())},
+        "items_delivered": api.media_items,
+        "items_per_second": round(api.media_items / wall, 2) if wall else 0.0,
+        "requests_per_second": round(outcome["requests"] / wall, 2) if wall else 0.0,
+        "uploaded_mb": round(api.uploaded_bytes / 1024 / 1024, 2),
+        "downloaded_mb": round(cdn.bytes_served / 1024 / 1024, 2),
+        "cdn_requests": cdn.requests,
+        "instagram_calls": dict(sorted(loader.calls.items())),
+        "pacing": {
+            "sleeps": pacing.calls,
+            "requested_seconds": round(pacing.requested, 2),
+            "longest_seconds": round(pacing.longest, 2),
+            "scale": args.pacing_scale,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "phases": dict(sorted(phases.items())),
+    }
+
+def previous_result(directory: str, params: dict) -> Optional[dict]:
+    for path in sorted(glob.glob(os.path.join(directory, "*.json")), reverse=True):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if result.get("params") == params:
+            return result
+    return None
+
+def print_report(result: dict, previous: Optional[dict]):
+    latency = result["latency"]
+    print(f"Revision {result['git_revision']} - {result['requests']} requests in {result['wall_seconds']}s "
+          f"({result['errors']} errors, {result['busy']} busy)")
+    print(f"Latency p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  p99 {latency['p99']:.3f}s")
+    for action, stats in result["latency_by_action"].items():
+        print(f"  {action:<16} n={stats['count']:<5} p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s  "
+              f"p99 {stats['p99']:.3f}s")
+    print(f"Items/sec {result['items_per_second']}  ({result['items_delivered']} items, "
+          f"{result['uploaded_mb']} MB up, {result['downloaded_mb']} MB down)")
+    pacing = result["pacing"]
+    print(f"Instagram calls {result['instagram_calls']}")
+    print(f"Pacing: {pacing['sleeps']} sleeps, longest {pacing['longest_seconds']}s, "
+          f"{pacing['requested_seconds']}s requested in total (scale {pacing['scale']})")
+    print(f"Peak RSS {result['peak_rss_mb']} MB")
+    if previous is None:
+        return
+
+    def change(now: float, before: float) -> str:
+        return f"{(now - before) / before * 100:+.1f}%" if before else "n/a"
+
+    print(f"Compared with {previous['git_revision']} ({previous['timestamp']}):")
+    for key in ("p50", "p95", "p99"):
+        print(f"  latency {key}: {previous['latency'][key]:.3f}s -> {latency[key]:.3f}s "
+              f"({change(latency[key], previous['latency'][key])})")
+    print(f"  items/sec: {previous['items_per_second']} -> {result['items_per_second']} "
+          f"({change(result['items_per_second'], previous['items_per_second'])})")
+    print(f"  peak RSS: {previous['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the bot")
+    parser.add_argument("--users", type=int, default=50, help="concurrent simulated users")
+    parser.add_argument("--sessions", type=int, default=2, help="profile URLs sent per user")
+    parser.add_argument("--profiles", type=int, default=40, help="distinct Instagram profiles")
+    parser.add_argument("--zipf", type=float, default=1.0, help="popularity skew across profiles")
+    parser.add_argument("--highlight-picks", type=int, default=1, help="highlights opened per menu")
+    parser.add_argument("--think-time", type=float, default=0.0, help="max pause between sessions (s)")
+    parser.add_argument("--stories", type=int, default=5, help="story items per profile")
+    parser.add_argument("--highlights", type=int, default=12, help="highlights per profile")
+    parser.add_argument("--highlight-items", type=int, default=8, help="items per highlight")
+    parser.add_argument("--video-ratio", type=float, default=0.3)
+    parser.add_argument("--photo-kb", type=int, default=150)
+    parser.add_argument("--video-kb", type=int, default=2048)
+    parser.add_argument("--ig-latency-ms", type=float, default=150, help="latency of each Instagram API call")
+    parser.add_argument("--cdn-latency-ms", type=float, default=20, help="latency of each CDN download")
+    parser.add_argument("--tg-latency-ms", type=float, default=60, help="latency of each Bot API call")
+    parser.add_argument("--tg-mbps", type=float, default=20, help="upload bandwidth to Telegram (MB/s)")
+    parser.add_argument("--pacing-scale", type=float, default=0.0,
+                        help="fraction of governor/jitter sleeps actually slept (0 = none, 1 = real)")
+    parser.add_argument("--workers", type=int, default=0, help="override executor.max_workers")
+    parser.add_argument("--transport", choices=("url", "stream", "disk"), help="override delivery.transport")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default=RESULTS_DIR, help="directory for result JSON files")
+    parser.add_argument("--no-save", action="store_true")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging({"logging": {"level": args.log_level, "format": "text"}})
+    result = asyncio.run(run_benchmark(args))
+    previous = previous_result(args.output, result["params"])
+    print_report(result, previous)
+    if not args.no_save:
+        os.makedirs(args.output, exist_ok=True)
+        stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = os.path.join(args.output, f"{stamp}_{result['git_revision']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved {path}")
+    stop_logging()
+
+if __name__ == "__main__":
+    main()
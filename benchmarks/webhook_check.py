@@ -0,0 +1,183 @@
+"""Uji mode webhook dari ujung ke ujung tanpa akun sungguhan.
+
+Menjalankan WebhookDispatcher dengan proses worker asli di atas FakeInstaloader, dan Bot API
+tiruan (FakeBotServer) sebagai pengganti api.telegram.org. Update dikirim ke endpoint webhook
+lewat HTTP, lalu balasan bot diperiksa dari panggilan yang tercatat di server tiruan.
+
+    python -m benchmarks.webhook_check --workers 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, List
+
+from benchmarks.fake_bot_server import FakeBotServer
+from benchmarks.fake_instagram import FakeCDN, FakeInstaloader, BenchInstagramClient
+from benchmarks.run import build_config
+from utils.callback_utils import encode_callback, STORY
+from utils.logging_utils import configure_logging, setup_logging
+from utils.webhook_utils import SECRET_HEADER, WebhookDispatcher, register_webhook, worker_config
+
+logger = setup_logging()
+
+ENV_VARS = {"TOKEN_BOT": "123456:CHECK", "INSTAGRAM_USERNAME": "check", "INSTAGRAM_PASSWORD": "check"}
+SECRET = "webhook-check-secret"
+
+def bench_webhook_worker(index: int, update_queue, env_vars: dict, config: dict):
+    """Sama seperti main.webhook_worker, tetapi InstagramClient memakai FakeInstaloader."""
+    from main import build_application
+    from utils.async_client import AsyncInstagramClient
+    from utils.webhook_utils import process_updates
+    configure_logging(config)
+    cdn = FakeCDN()
+    instagram = BenchInstagramClient(env_vars, config, loader=FakeInstaloader(cdn, stories_per_profile=3))
+    logger.info("Check worker %s: %.1f requests/min, burst %s",
+                index, instagram.governor.max_rate * 60, instagram.governor.burst)
+    async_client = AsyncInstagramClient(instagram, config)
+    application = build_application(env_vars, async_client, with_updater=False, config=config)
+
+    async def run():
+        async_client.start_background()
+        try:
+            await process_updates(application, update_queue)
+        finally:
+            await async_client.shutdown()
+            cdn.close()
+
+    asyncio.run(run())
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def post_update(url: str, update: dict, secret: str = SECRET) -> int:
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json", SECRET_HEADER: secret}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "language_code": "id"}
+
+def chat(user_id: int) -> dict:
+    return {"id": user_id, "type": "private"}
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "chat": chat(user_id), "from": user(user_id), "text": text
+    }}
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user(user_id), "chat_instance": str(user_id), "data": data,
+        "message": {"message_id": update_id, "date": int(time.time()), "chat": chat(user_id), "text": "menu"}
+    }}
+
+def wait_for(condition: Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+def run_check(args) -> List[str]:
+    """Jalankan skenario webhook; kembalikan daftar kegagalan (kosong jika lolos)."""
+    workdir = tempfile.mkdtemp(prefix="instbot-webhook-")
+    config = build_config(argparse.Namespace(workers=0, transport=None), workdir)
+    config["logging"] = {"level": args.log_level, "format": "text", "async": False}
+    config.setdefault("prefetch", {})["enabled"] = False
+    config["rate_limit"]["jitter_seconds"] = 0
+    port = free_port()
+    config["webhook"] = {
+        "listen": "127.0.0.1", "port": port, "path": "/telegram", "public_url": f"http://127.0.0.1:{port}",
+        "secret_token": SECRET, "workers": args.workers, "queue_size": 100
+    }
+    bot = FakeBotServer()
+    config["telegram_base_url"] = bot.base_url
+    failures = []
+
+    per_worker = worker_config(config)
+    expected_rate = config["rate_limit"]["requests_per_minute"] / args.workers
+    if abs(per_worker["rate_limit"]["requests_per_minute"] - expected_rate) > 1e-9:
+        failures.append(f"worker rate {per_worker['rate_limit']['requests_per_minute']} != {expected_rate}")
+
+    asyncio.run(register_webhook(ENV_VARS["TOKEN_BOT"], config, bot.base_url))
+    registered = bot.calls_to("setWebhook")
+    if not registered or registered[0].get("secret_token") != SECRET:
+        failures.append("setWebhook was not called with the secret token")
+
+    dispatcher = WebhookDispatcher(config, bench_webhook_worker, worker_args=(ENV_VARS, per_worker))
+    server_thread = threading.Thread(target=dispatcher.serve_forever, name="webhook-check", daemon=True)
+    server_thread.start()
+    url = f"http://127.0.0.1:{port}/telegram"
+    try:
+        # getMe: satu dari register_webhook, lalu satu per worker saat Application diinisialisasi
+        ready = args.workers + len(registered)
+        if not wait_for(lambda: dispatcher.server is not None and len(bot.calls_to("getMe")) >= ready, args.timeout):
+            failures.append("webhook workers did not start")
+            return failures
+
+        if post_update(url, message_update(1, 1, "https://www.instagram.com/alpha/"), secret="wrong") != 403:
+            failures.append("update with a wrong secret token was accepted")
+
+        user_ids = list(range(1, args.users + 1))
+        update_ids = iter(range(10, 10 ** 6))
+        for user_id in user_ids:
+            text = f"https://www.instagram.com/u{user_id}/"
+            status = post_update(url, message_update(next(update_ids), user_id, text))
+            if status != 200:
+                failures.append(f"message update for user {user_id} returned {status}")
+        menus = lambda: {int(params["chat_id"]) for params in bot.calls_to(
+            "sendMessage", lambda p: "reply_markup" in p)}
+        if not wait_for(lambda: set(user_ids) <= menus(), args.timeout):
+            failures.append(f"feature menu missing for users {sorted(set(user_ids) - menus())}")
+
+        for user_id in user_ids:
+            post_update(url, callback_update(next(update_ids), user_id, encode_callback(STORY, f"u{user_id}")))
+        summaries = lambda: {int(params["chat_id"]) for params in bot.calls_to(
+            "sendMessage", lambda p: p.get("text", "").startswith("📤 Total"))}
+        if not wait_for(lambda: set(user_ids) <= summaries(), args.timeout):
+            failures.append(f"stories not delivered to users {sorted(set(user_ids) - summaries())}")
+        return failures
+    finally:
+        if dispatcher.server is not None:
+            dispatcher.server.shutdown()  # serve_forever kembali lalu menghentikan worker
+        server_thread.join(timeout=30)
+        print(f"Bot API calls: {json.dumps(bot.counts(), sort_keys=True)}, uploaded {bot.uploaded_bytes} bytes")
+        bot.close()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end check of webhook mode against a fake Bot API")
+    parser.add_argument("--workers", type=int, default=2, help="webhook worker processes")
+    parser.add_argument("--users", type=int, default=4, help="simulated users sending updates")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for each step")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # main.py membaca config/ relatif
+    configure_logging({"logging": {"level": args.log_level, "format": "text", "async": False}})
+    failures = run_check(args)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("Webhook check passed" if not failures else f"Webhook check failed ({len(failures)} problems)")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,107 +1,224 @@
-import os
+import asyncio
 import pytz
-import time
-from typing import List, Optional
+from typing import AsyncIterator, Callable, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from instaloader import Profile, QueryReturnedBadRequestException
-from utils.file_utils import get_latest_file, create_temp_dir, cleanup_temp_dir
-from utils.instagram_utils import InstagramClient
+from handlers.media_delivery import deliver_items
+from utils.async_client import AsyncInstagramClient, ExecutorBusyError
+from utils.callback_utils import (
+    encode_callback, HIGHLIGHTS, HIGHLIGHT_ITEMS, RESUME_HIGHLIGHT, STOP_HIGHLIGHT, STORY_ALL
+)
+from utils.checkpoint_store import get_checkpoint_store
+from utils.file_id_cache import get_file_id_cache
+from utils.job_registry import delivery_jobs
 from utils.logging_utils import setup_logging, log_errors
+from utils.metrics import timed
+from utils.profile_pic_cache import get_profile_pic_cache, profile_pic_key
+from utils.watermark_store import get_watermark_store, watermark_key
 
 logger = setup_logging()
 
 @log_errors(logger)
-async def handle_profile_pic(query, username: str, client: InstagramClient, config: dict, lang: str):
-    logger.info(f"Handling profile picture request for {username}")
-    profile = client.get_profile(username)
+@timed("instbot_handler_seconds", label="handler")
+async def handle_profile_pic(query, username: str, client: AsyncInstagramClient, config: dict, lang: str):
+    logger.info("Handling profile picture request for %s", username)
+    profile = await client.get_profile(username)
     if profile.is_private and not profile.followed_by_viewer:
-        logger.warning(f"Profile {username} is private and not followed")
+        logger.warning("Profile %s is private and not followed", username)
         await query.message.reply_text(config["languages"][lang]["private_profile"])
         return
 
-    hd_url = profile.profile_pic_url.replace("/s150x150/", "/s1080x1080/")
-    logger.debug(f"Fetching profile picture from URL: {hd_url}")
-    response = requests.get(hd_url, headers=client.get_random_headers(), stream=True)
-    response.raise_for_status()
-
-    with tempfile.NamedTemporaryFile(delete=True, suffix='.jpg') as temp_file:
-        response.raw.decode_content = True
-        for chunk in response.iter_content(chunk_size=8192):
-            temp_file.write(chunk)
-        temp_file.seek(0)
-        logger.info(f"Sending profile picture for {username}")
-        await query.message.reply_document(
-            document=temp_file,
-            filename=f"{username}_profile.jpg",
-            caption=f"📸 Foto Profil @{username}"
-        )
+    hd_url = (await client.get_profile_pic_url(profile)).replace("/s150x150/", "/s1080x1080/")
+    cache_key = profile_pic_key(username, hd_url)
+    caption = f"📸 Foto Profil @{username}"
+    file_ids = get_file_id_cache(config)
+    cached = await asyncio.to_thread(file_ids.get, cache_key)
+    if cached:
+        # ID aset sama berarti gambar sama; kirim ulang tanpa menyentuh CDN
+        try:
+            await query.message.reply_document(document=cached[0], caption=caption)
+            logger.info("Re-sent profile picture for %s from cached file_id", username)
+            return
+        except BadRequest as e:
+            logger.warning("Cached file_id for %s rejected, uploading again: %s", cache_key, e)
+            await asyncio.to_thread(file_ids.invalidate, cache_key)
+
+    data = await load_profile_pic(hd_url, cache_key, client, config)
+    logger.info("Sending profile picture for %s", username)
+    message = await query.message.reply_document(
+        document=data,
+        filename=f"{username}_profile.jpg",
+        caption=caption
+    )
+    if message.document:
+        await asyncio.to_thread(file_ids.set, cache_key, message.document.file_id, "document")
+
+async def load_profile_pic(url: str, cache_key: str, client: AsyncInstagramClient, config: dict) -> bytes:
+    """Isi foto profil dari cache lokal; revalidasi dengan request kondisional jika entrinya sudah lama."""
+    cache = get_profile_pic_cache(config)
+    entry = await asyncio.to_thread(cache.get, cache_key)
+    if entry is not None and cache.is_fresh(entry):
+        return entry.data
+    if entry is None:
+        response = await client.fetch_profile_pic(url)
+    else:
+        response = await client.fetch_profile_pic(url, etag=entry.etag, last_modified=entry.last_modified)
+        if response.status_code == 304:
+            await asyncio.to_thread(cache.mark_validated, cache_key)
+            return entry.data
+    await asyncio.to_thread(
+        cache.set, cache_key, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified")
+    )
+    return response.content
+
+def story_caption(config: dict, username: Optional[str] = None) -> Callable:
+    time_zone = pytz.timezone(config["timezone"])
+    prefix = f"@{username} " if username else ""
+
+    def caption_for(idx: int, story_item) -> str:
+        local_time = story_item.date_utc.replace(tzinfo=pytz.utc).astimezone(time_zone)
+        return f"{prefix}{'📹' if story_item.is_video else '📸'} {local_time.strftime('%d-%m-%Y %H:%M')}"
+
+    return caption_for
+
+async def unseen_stories(user_id: int, profile_id: int, stories: List, config: dict,
+                         send_all: bool = False) -> List:
+    """Urutkan stories; kecuali send_all, buang item yang sudah terkirim menurut watermark pengguna."""
+    stories = sorted(stories, key=watermark_key)  # Salinan; list bisa dipakai bersama permintaan lain
+    watermark = None if send_all else await asyncio.to_thread(get_watermark_store(config).get, user_id, profile_id)
+    if watermark is None:
+        return stories
+    return [item for item in stories if watermark_key(item) > watermark]
+
+def send_all_keyboard(username: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("🔁 Kirim semua lagi", callback_data=encode_callback(STORY_ALL, username))
+    ]])
 
 @log_errors(logger)
-async def handle_stories(query, username: str, client: InstagramClient, config: dict, lang: str):
-    logger.info(f"Handling stories request for {username}")
-    profile = client.get_profile(username)
+@timed("instbot_handler_seconds", label="handler")
+async def handle_stories(query, username: str, client: AsyncInstagramClient, config: dict, lang: str,
+                         send_all: bool = False):
+    """Kirim story yang belum pernah diterima pengguna ini; send_all=True mengirim ulang semuanya."""
+    logger.info("Handling stories request for %s (send_all=%s)", username, send_all)
+    profile = await client.get_profile(username)
     if profile.is_private and not profile.followed_by_viewer:
-        logger.warning(f"Profile {username} is private and not followed")
+        logger.warning("Profile %s is private and not followed", username)
         await query.message.reply_text(config["languages"][lang]["private_profile"])
         return
+    client.prefetcher.record(profile.username)  # Hanya profil yang ada dan bisa dibaca
 
     stories = []
     try:
-        stories = client.get_stories([profile.userid])
+        stories = await client.get_stories([profile.userid])
     except QueryReturnedBadRequestException as e:
-        logger.error(f"Instagram API denied access to stories for {username}: {str(e)}")
+        logger.error("Instagram API denied access to stories for %s: %s", username, e)
         await query.message.reply_text(config["languages"][lang]["private_profile"])
         return
 
     if not stories:
-        logger.info(f"No stories available for {username}")
+        logger.info("No stories available for %s", username)
         await query.message.reply_text(config["languages"][lang]["no_stories"])
         return
 
-    stories.sort(key=lambda x: x.date_utc)
-    time_zone = pytz.timezone(config["timezone"])
-    temp_dir = create_temp_dir(f"temp_{username}_")
-    sent_count = 0
+    total = len(stories)
+    user_id = query.from_user.id
+    stories = await unseen_stories(user_id, profile.userid, stories, config, send_all)
+    if not stories:
+        logger.info("No new stories for %s since last delivery to user %s", username, user_id)
+        await query.message.reply_text(
+            "✅ Tidak ada story baru sejak permintaan terakhir", reply_markup=send_all_keyboard(username)
+        )
+        return
 
-    try:
-        for story_item in stories:
-            client.download_storyitem(story_item, temp_dir)
-            latest_file = get_latest_file(temp_dir)
-            if not latest_file:
-                logger.warning(f"No valid file downloaded for story item {story_item.mediaid}")
-                continue
+    sent_count = await deliver_items(
+        query, stories, client, config, story_caption(config),
+        on_delivered=lambda items: get_watermark_store(config).advance(user_id, profile.userid, items)
+    )
+    logger.info("Sent %s stories for %s", sent_count, username)
+    skipped = total - len(stories)
+    if skipped:
+        await query.message.reply_text(
+            f"📤 Total {sent_count} story baru berhasil dikirim ({skipped} story lama dilewati)",
+            reply_markup=send_all_keyboard(username)
+        )
+    else:
+        await query.message.reply_text(f"📤 Total {sent_count} story berhasil dikirim")
 
-            file_size = os.path.getsize(latest_file)
-            if file_size > config["max_file_size_mb"] * 1024 * 1024:
-                logger.warning(f"File {latest_file} exceeds size limit: {file_size} bytes")
-                await query.message.reply_text("⚠️ File melebihi batas ukuran")
-                os.remove(latest_file)
-                continue
+@log_errors(logger)
+@timed("instbot_handler_seconds", label="handler")
+async def handle_batch_stories(query, usernames: List[str], client: AsyncInstagramClient, config: dict, lang: str):
+    """Stories beberapa profil: satu query reel untuk semuanya, lalu dikirim per profil secara bersamaan."""
+    logger.info("Handling batch stories request for %s profiles", len(usernames))
+    results = await asyncio.gather(*(client.get_profile(username) for username in usernames), return_exceptions=True)
+    profiles, skipped = [], []
+    for username, result in zip(usernames, results):
+        if isinstance(result, ExecutorBusyError):
+            raise result
+        if isinstance(result, Exception):
+            logger.warning("Could not load profile %s for batch: %s", username, result)
+            skipped.append(f"@{username} (tidak ditemukan)")
+        elif result.is_private and not result.followed_by_viewer:
+            skipped.append(f"@{username} (privat)")
+        else:
+            client.prefetcher.record(result.username)
+            profiles.append(result)
 
-            local_time = story_item.date_utc.replace(tzinfo=pytz.utc).astimezone(time_zone)
-            caption = f"{'📹' if story_item.is_video else '📸'} {local_time.strftime('%d-%m-%Y %H:%M')}"
-            with open(latest_file, "rb") as f:
-                logger.info(f"Sending story item {story_item.mediaid} for {username}")
-                if story_item.is_video:
-                    await query.message.reply_video(video=f, caption=caption, read_timeout=60, write_timeout=60)
-                else:
-                    await query.message.reply_photo(photo=f, caption=caption, read_timeout=60)
-            sent_count += 1
-            os.remove(latest_file)
-
-        logger.info(f"Sent {sent_count} stories for {username}")
-        await query.message.reply_text(f"📤 Total {sent_count} story berhasil dikirim")
-    finally:
-        cleanup_temp_dir(temp_dir)
+    stories_by_user = {}
+    if profiles:
+        try:
+            stories_by_user = await client.get_stories_by_user([profile.userid for profile in profiles])
+        except QueryReturnedBadRequestException as e:
+            logger.error("Instagram API denied access to batch stories: %s", e)
+            await query.message.reply_text(config["languages"][lang]["private_profile"])
+            return
+
+    semaphore = asyncio.Semaphore(max(1, config.get("batch", {}).get("concurrency", 3)))
+
+    user_id = query.from_user.id
+    watermarks = get_watermark_store(config)
+    unseen = {
+        profile.userid: await unseen_stories(
+            user_id, profile.userid, stories_by_user.get(profile.userid, []), config
+        )
+        for profile in profiles
+    }
+
+    async def deliver_profile(profile) -> int:
+        stories = unseen[profile.userid]
+        if not stories:
+            return 0
+        async with semaphore:
+            return await deliver_items(
+                query, stories, client, config, story_caption(config, profile.username),
+                on_delivered=lambda items: watermarks.advance(user_id, profile.userid, items)
+            )
+
+    counts = await asyncio.gather(*(deliver_profile(profile) for profile in profiles))
+    empty = [f"@{profile.username}" for profile in profiles if not stories_by_user.get(profile.userid)]
+    seen = [f"@{profile.username}" for profile in profiles
+            if stories_by_user.get(profile.userid) and not unseen[profile.userid]]
+    delivered_profiles = len(profiles) - len(empty) - len(seen)
+    summary = [f"📤 Total {sum(counts)} story baru dari {delivered_profiles} profil berhasil dikirim"]
+    if seen:
+        summary.append(f"✅ Tidak ada story baru: {', '.join(seen)}")
+    if empty:
+        summary.append(f"📭 Tanpa story: {', '.join(empty)}")
+    if skipped:
+        summary.append(f"⚠️ Dilewati: {', '.join(skipped)}")
+    logger.info("Sent %s stories for %s profiles", sum(counts), len(profiles))
+    await query.message.reply_text("\n".join(summary))
 
 @log_errors(logger)
-async def handle_highlights(query, username: str, client: InstagramClient, config: dict, lang: str, page: int = 0):
-    logger.info(f"Handling highlights request for {username}, page {page}")
-    profile = client.get_profile(username)
-    highlights = client.get_highlights(profile)
+@timed("instbot_handler_seconds", label="handler")
+async def handle_highlights(query, username: str, client: AsyncInstagramClient, config: dict, lang: str, page: int = 0):
+    logger.info("Handling highlights request for %s, page %s", username, page)
+    profile = await client.get_profile(username)
+    highlights = await client.get_highlights(profile)
 
     if not highlights:
-        logger.info(f"No highlights available for {username}")
+        logger.info("No highlights available for %s", username)
         await query.message.reply_text("🌟 Tidak ada highlights yang tersedia")
         return
 
@@ -109,7 +226,7 @@ async def handle_highlights(query, username: str, client: InstagramClient, confi
     start_idx = page * items_per_page
     end_idx = start_idx + items_per_page
     current_highlights = highlights[start_idx:end_idx]
-    logger.debug(f"Displaying highlights {start_idx} to {end_idx} out of {len(highlights)}")
+    logger.debug("Displaying highlights %s to %s out of %s", start_idx, end_idx, len(highlights))
 
     keyboard = []
     for highlight in current_highlights:
@@ -117,87 +234,137 @@ async def handle_highlights(query, username: str, client: InstagramClient, confi
         keyboard.append([
             InlineKeyboardButton(
                 f"🌟 {title}",
-                callback_data=f"highlight_{highlight.unique_id}"
+                callback_data=encode_callback(HIGHLIGHT_ITEMS, username, highlight.unique_id)
             )
         ])
 
     navigation_buttons = []
     if page > 0:
         navigation_buttons.append(
-            InlineKeyboardButton("⏪ Kembali", callback_data=f"highlights_prev_{page - 1}")
+            InlineKeyboardButton("⏪ Kembali", callback_data=encode_callback(HIGHLIGHTS, username, page - 1))
         )
     if len(highlights) > end_idx:
         navigation_buttons.append(
-            InlineKeyboardButton("⏩ Lanjutkan", callback_data=f"highlights_next_{page + 1}")
+            InlineKeyboardButton("⏩ Lanjutkan", callback_data=encode_callback(HIGHLIGHTS, username, page + 1))
         )
 
     if navigation_buttons:
         keyboard.append(navigation_buttons)
 
     reply_markup = InlineKeyboardMarkup(keyboard)
-    logger.info(f"Sending highlights menu for {username}")
+    logger.info("Sending highlights menu for %s", username)
     await query.message.reply_text(
         f"Pilih highlight untuk @{username} (Halaman {page + 1}):",
         reply_markup=reply_markup
     )
 
-@log_errors(logger)
-async def handle_highlight_items(query, username: str, highlight_id: str, client: InstagramClient, config: dict, lang: str):
-    logger.info(f"Handling highlight items request for {username}, highlight ID {highlight_id}")
-    profile = client.get_profile(username)
-    highlights = client.get_highlights(profile)
+def highlight_control_keyboard(action: str, username: str, highlight_id) -> InlineKeyboardMarkup:
+    label = "⏹ Stop" if action == STOP_HIGHLIGHT else "▶️ Lanjutkan"
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton(label, callback_data=encode_callback(action, username, highlight_id))
+    ]])
 
-    highlight_id_int = int(highlight_id)
-    highlight = next((h for h in highlights if h.unique_id == highlight_id_int), None)
+@log_errors(logger)
+@timed("instbot_handler_seconds", label="handler")
+async def handle_highlight_items(query, username: str, highlight_id: str, client: AsyncInstagramClient, config: dict,
+                                 lang: str, resume: bool = False):
+    logger.info("Handling highlight items request for %s, highlight ID %s (resume=%s)", username, highlight_id, resume)
+    profile = await client.get_profile(username)
+    highlight = await client.get_highlight(profile, int(highlight_id))
 
     if not highlight:
-        logger.warning(f"Highlight with ID {highlight_id} not found for {username}")
+        logger.warning("Highlight with ID %s not found for %s", highlight_id, username)
         await query.message.reply_text("❌ Highlight tidak ditemukan")
         return
 
-    temp_dir = create_temp_dir(f"temp_highlight_{username}_")
-    sent_count = 0
+    user_id = query.from_user.id
+    checkpoints = get_checkpoint_store(config)
+    delivered = await asyncio.to_thread(checkpoints.delivered, user_id, highlight.unique_id) if resume else set()
     time_zone = pytz.timezone(config["timezone"])
+    positions = {}  # mediaid -> nomor urut di highlight, agar penomoran tetap sama saat dilanjutkan
 
-    highlight_items = list(highlight.get_items())
-    logger.info(f"Processing {len(highlight_items)} items from highlight '{highlight.title}'")
-    await query.message.reply_text(f"🔄 Memproses {len(highlight_items)} item dari highlight '{highlight.title}'")
+    opened = asyncio.get_running_loop().create_future()  # Jumlah item, diketahui setelah stream dibuka
 
-    try:
-        for idx, item in enumerate(highlight_items, start=1):
-            client.download_storyitem(item, temp_dir)
-            latest_file = get_latest_file(temp_dir)
-            if not latest_file:
-                logger.warning(f"No valid file downloaded for highlight item {item.mediaid}")
+    async def pending_items(items: AsyncIterator):
+        position = 0
+        async for item in items:
+            position += 1
+            if str(item.mediaid) in delivered:
                 continue
+            positions[item.mediaid] = position
+            yield item
 
-            file_size = os.path.getsize(latest_file)
-            if file_size > config["max_file_size_mb"] * 1024 * 1024:
-                logger.warning(f"File {latest_file} exceeds size limit: {file_size} bytes")
-                await query.message.reply_text("⚠️ File melebihi batas ukuran")
-                os.remove(latest_file)
-                continue
+    def caption_for(idx: int, item) -> str:
+        local_time = item.date_utc.replace(tzinfo=pytz.utc).astimezone(time_zone)
+        return (f"**[{positions.get(item.mediaid, idx)}]**.🌟 {highlight.title} - "
+                f"{'📹' if item.is_video else '📸'} {local_time.strftime('%d-%m-%Y %H:%M')}")
+
+    def on_delivered(items: List):
+        checkpoints.mark(user_id, highlight.unique_id, [item.mediaid for item in items])
+
+    async def run_delivery() -> int:
+        # Checkpoint lama baru dihapus di dalam job: jika job yang sama masih berjalan, coroutine ini
+        # tidak pernah dijalankan dan checkpoint job tersebut tetap utuh
+        if not resume:
+            await asyncio.to_thread(checkpoints.clear, user_id, highlight.unique_id)
+        total, items = await client.open_highlight_stream(
+            highlight, config.get("delivery", {}).get("stream_chunk", 5)
+        )
+        opened.set_result(total)
+        return await deliver_items(query, pending_items(items), client, config, caption_for, on_delivered)
 
-            local_time = item.date_utc.replace(tzinfo=pytz.utc).astimezone(time_zone)
-            caption = f"**[{idx}]**.🌟 {highlight.title} - {'📹' if item.is_video else '📸'} {local_time.strftime('%d-%m-%Y %H:%M')}"
-            with open(latest_file, "rb") as f:
-                logger.info(f"Sending highlight item {item.mediaid} for {username}")
-                if item.is_video:
-                    await query.message.reply_video(video=f, caption=caption, read_timeout=60, write_timeout=60)
-                else:
-                    await query.message.reply_photo(photo=f, caption=caption, read_timeout=60)
-            sent_count += 1
-            os.remove(latest_file)
-
-        logger.info(f"Sent {sent_count} items from highlight '{highlight.title}'")
-        await query.message.reply_text(f"✅ {sent_count} item dari highlight '{highlight.title}' berhasil dikirim")
-    finally:
-        cleanup_temp_dir(temp_dir)
+    job = delivery_jobs.start((user_id, highlight.unique_id), run_delivery())
+    if job is None:
+        await query.message.reply_text(f"⏳ Highlight '{highlight.title}' masih dalam proses pengiriman")
+        return
+
+    # itemcount highlight butuh request Instagram; tunggu job membukanya di worker
+    await asyncio.wait((opened, job.task), return_when=asyncio.FIRST_COMPLETED)
+    if opened.done():
+        remaining = opened.result() - len(delivered)
+        logger.info("Streaming %s items from highlight '%s'", remaining, highlight.title)
+        await query.message.reply_text(
+            f"🔄 {'Melanjutkan' if resume else 'Memproses'} {remaining} item dari highlight '{highlight.title}'",
+            reply_markup=highlight_control_keyboard(STOP_HIGHLIGHT, username, highlight.unique_id)
+        )
+
+    try:
+        sent_count = await job.task
+    except asyncio.CancelledError:
+        if not job.stopped:
+            raise
+        done = len(await asyncio.to_thread(checkpoints.delivered, user_id, highlight.unique_id))
+        logger.info("Delivery of highlight '%s' stopped by user after %s items", highlight.title, done)
+        await query.message.reply_text(
+            f"⏹ Pengiriman highlight '{highlight.title}' dihentikan ({done} item terkirim)",
+            reply_markup=highlight_control_keyboard(RESUME_HIGHLIGHT, username, highlight.unique_id)
+        )
+        return
+    except Exception as e:
+        done = len(await asyncio.to_thread(checkpoints.delivered, user_id, highlight.unique_id))
+        logger.error("Delivery of highlight '%s' failed after %s items: %s", highlight.title, done, e)
+        await query.message.reply_text(
+            f"⚠️ Pengiriman highlight '{highlight.title}' terputus setelah {done} item",
+            reply_markup=highlight_control_keyboard(RESUME_HIGHLIGHT, username, highlight.unique_id)
+        )
+        return
+
+    await asyncio.to_thread(checkpoints.clear, user_id, highlight.unique_id)
+    logger.info("Sent %s items from highlight '%s'", sent_count, highlight.title)
+    await query.message.reply_text(f"✅ {sent_count} item dari highlight '{highlight.title}' berhasil dikirim")
+
+@log_errors(logger)
+async def stop_highlight_items(query, highlight_id: str):
+    if delivery_jobs.stop((query.from_user.id, int(highlight_id))):
+        await query.message.reply_text("⏹ Menghentikan pengiriman...")
+    else:
+        await query.message.reply_text("ℹ️ Tidak ada pengiriman yang sedang berjalan")
 
 @log_errors(logger)
-async def handle_profile_info(query, username: str, client: InstagramClient, config: dict, lang: str):
-    logger.info(f"Handling profile info request for {username}")
-    profile = client.get_profile(username)
+@timed("instbot_handler_seconds", label="handler")
+async def handle_profile_info(query, username: str, client: AsyncInstagramClient, config: dict, lang: str):
+    logger.info("Handling profile info request for %s", username)
+    profile = await client.get_profile(username)
     info_text = (
         f"📊 Info Profil @{username}:\n"
         f"👤 Nama: {profile.full_name}\n"
@@ -208,5 +375,5 @@ async def handle_profile_info(query, username: str, client: InstagramClient, con
         f"👀 Following: {profile.followees:,}\n"
         f"📌 Post: {profile.mediacount:,}"
     )
-    logger.info(f"Sending profile info for {username}")
+    logger.info("Sending profile info for %s", username)
     await query.message.reply_text(info_text)
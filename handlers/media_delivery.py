@@ -0,0 +1,264 @@
+import asyncio
+import os
+from typing import AsyncIterable, Callable, Iterable, List, Optional, Union
+from telegram import InputMediaPhoto, InputMediaVideo
+from telegram.error import BadRequest
+from utils.file_utils import get_latest_file, create_temp_dir, cleanup_temp_dir
+from utils.file_id_cache import get_file_id_cache
+from utils.async_client import AsyncInstagramClient
+from utils.http_utils import MediaTooLargeError
+from utils.logging_utils import setup_logging
+from utils.metrics import REGISTRY, timer
+
+logger = setup_logging()
+
+MAX_ALBUM_SIZE = 10  # Batas send_media_group dari Telegram
+TRANSPORTS = ("url", "stream", "disk")
+
+class PreparedItem:
+    """Item yang siap dikirim: file_id dari cache, URL CDN, atau isi file di memori."""
+
+    def __init__(self, item, caption: str, media: Union[str, bytes, None] = None, source: str = "bytes",
+                 oversized: bool = False):
+        self.item = item
+        self.caption = caption
+        self.media = media
+        self.source = source  # "file_id", "url" atau "bytes"
+        self.oversized = oversized
+
+    @property
+    def filename(self) -> str:
+        return f"{self.item.mediaid}.{'mp4' if self.item.is_video else 'jpg'}"
+
+async def reply_media(message, media, is_video: bool, caption: str, filename: Optional[str] = None):
+    """Kirim foto/video; media boleh berupa file_id, URL, bytes, atau file object."""
+    if isinstance(media, bytes):
+        REGISTRY.inc("instbot_uploaded_bytes_total", len(media))
+    with timer("instbot_telegram_upload_seconds", kind="video" if is_video else "photo"):
+        if is_video:
+            return await message.reply_video(
+                video=media, caption=caption, filename=filename, read_timeout=60, write_timeout=60
+            )
+        return await message.reply_photo(photo=media, caption=caption, filename=filename, read_timeout=60)
+
+async def remember_file_id(item, message, config: dict):
+    """Simpan file_id hasil upload agar pengiriman berikutnya tidak perlu upload ulang."""
+    # Tulis SQLite di thread terpisah agar event loop tidak ikut menunggu disk
+    if item.is_video and message.video:
+        await asyncio.to_thread(get_file_id_cache(config).set, item.mediaid, message.video.file_id, "video")
+    elif not item.is_video and message.photo:
+        await asyncio.to_thread(get_file_id_cache(config).set, item.mediaid, message.photo[-1].file_id, "photo")
+
+async def download_to_disk(item, client: AsyncInstagramClient) -> Optional[bytes]:
+    """Jalur cadangan: unduh lewat instaloader ke direktori sementara lalu baca isinya."""
+    temp_dir = create_temp_dir(f"temp_{item.mediaid}_")
+    try:
+        await client.download_storyitem(item, temp_dir)
+        latest_file = get_latest_file(temp_dir)
+        if not latest_file:
+            logger.warning("No valid file downloaded for item %s", item.mediaid)
+            return None
+        size = os.path.getsize(latest_file)
+        if size > client.max_media_bytes:
+            raise MediaTooLargeError(size, client.max_media_bytes, "disk")
+        with open(latest_file, "rb") as f:
+            return f.read()
+    finally:
+        cleanup_temp_dir(temp_dir)
+
+async def load_media(item, client: AsyncInstagramClient, transport: str) -> Optional[bytes]:
+    """Ambil isi media langsung dari CDN; disk hanya dipakai jika streaming gagal."""
+    if transport != "disk":
+        try:
+            return await client.fetch_media(item)
+        except MediaTooLargeError:
+            raise  # Jalur disk tidak akan menghasilkan file yang lebih kecil
+        except Exception as e:
+            logger.warning("Streaming item %s failed, falling back to disk: %s", item.mediaid, e)
+    return await download_to_disk(item, client)
+
+async def prepare_item(item, caption: str, client: AsyncInstagramClient, config: dict,
+                       transport: str) -> Optional[PreparedItem]:
+    cached = await asyncio.to_thread(get_file_id_cache(config).get, item.mediaid)
+    if cached:
+        return PreparedItem(item, caption, media=cached[0], source="file_id")
+
+    if transport == "url":
+        try:
+            return PreparedItem(item, caption, media=await client.resolve_media_url(item), source="url")
+        except Exception as e:
+            logger.warning("Could not resolve URL for item %s: %s", item.mediaid, e)
+
+    try:
+        data = await load_media(item, client, transport)
+    except MediaTooLargeError as e:
+        logger.warning("Item %s exceeds size limit: %s", item.mediaid, e)
+        return PreparedItem(item, caption, oversized=True)
+    if data is None:
+        return None
+    return PreparedItem(item, caption, media=data)
+
+async def send_single(query, prepared: PreparedItem, client: AsyncInstagramClient, config: dict,
+                      transport: str) -> List[PreparedItem]:
+    """Kirim satu item; kembalikan daftar item yang selesai (kosong jika gagal).
+
+    Item yang ternyata terlalu besar juga dianggap selesai, dengan oversized=True.
+    """
+    item = prepared.item
+    if prepared.source != "bytes":
+        try:
+            message = await reply_media(query.message, prepared.media, item.is_video, prepared.caption)
+            if prepared.source == "file_id":
+                logger.info("Re-sent item %s from cached file_id", item.mediaid)
+            else:
+                await remember_file_id(item, message, config)
+            return [prepared]
+        except BadRequest as e:
+            # file_id basi atau Telegram gagal mengambil URL; unggah isinya sendiri
+            logger.warning("Telegram rejected %s for %s, uploading bytes: %s", prepared.source, item.mediaid, e)
+            if prepared.source == "file_id":
+                await asyncio.to_thread(get_file_id_cache(config).invalidate, item.mediaid)
+            try:
+                data = await load_media(item, client, "stream" if transport == "url" else transport)
+            except MediaTooLargeError as e:
+                # Sama seperti item besar di prepare_item: beri tahu pengguna, jangan ulangi item ini
+                logger.warning("Item %s exceeds size limit: %s", item.mediaid, e)
+                await query.message.reply_text("⚠️ File melebihi batas ukuran")
+                prepared.media, prepared.oversized = None, True
+                return [prepared]
+            if data is None:
+                return []
+            prepared.media, prepared.source = data, "bytes"
+
+    logger.info("Uploading item %s (%s bytes)", item.mediaid, len(prepared.media))
+    message = await reply_media(query.message, prepared.media, item.is_video, prepared.caption, prepared.filename)
+    await remember_file_id(item, message, config)
+    return [prepared]
+
+async def send_album(query, batch: List[PreparedItem], client: AsyncInstagramClient, config: dict,
+                     transport: str) -> List[PreparedItem]:
+    if len(batch) == 1:
+        return await send_single(query, batch[0], client, config, transport)
+
+    media = []
+    for prepared in batch:
+        media_class = InputMediaVideo if prepared.item.is_video else InputMediaPhoto
+        filename = prepared.filename if prepared.source == "bytes" else None
+        media.append(media_class(media=prepared.media, caption=prepared.caption, filename=filename))
+
+    try:
+        logger.info("Sending album of %s items", len(batch))
+        with timer("instbot_telegram_upload_seconds", kind="album"):
+            messages = await query.message.reply_media_group(media=media, read_timeout=60, write_timeout=60)
+        REGISTRY.inc(
+            "instbot_uploaded_bytes_total",
+            sum(len(prepared.media) for prepared in batch if prepared.source == "bytes")
+        )
+    except BadRequest as e:
+        # Biasanya karena file_id basi atau URL yang tidak bisa diambil; kirim satu per satu
+        logger.warning("Album upload rejected, falling back to single sends: %s", e)
+        delivered = []
+        for prepared in batch:
+            delivered.extend(await send_single(query, prepared, client, config, transport))
+        return delivered
+
+    for prepared, message in zip(batch, messages):
+        if prepared.source != "file_id":
+            await remember_file_id(prepared.item, message, config)
+    return batch
+
+async def iterate(items: Union[Iterable, AsyncIterable]):
+    """Samakan list biasa dan async iterator (stream item) menjadi satu async iterator."""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def deliver_items(query, items: Union[Iterable, AsyncIterable], client: AsyncInstagramClient, config: dict,
+                        caption_for: Callable, on_delivered: Optional[Callable[[List], None]] = None) -> int:
+    """Unduh beberapa item di depan sambil mengunggah item saat ini; urutan kirim tetap.
+
+    items boleh berupa async iterator sehingga item dikirim begitu tiba. on_delivered dipanggil di
+    thread terpisah dengan item yang sudah selesai (terkirim, atau dilewati karena terlalu besar).
+    """
+    delivery_config = config.get("delivery", {})
+    prefetch = max(1, delivery_config.get("prefetch", 3))
+    album_mode = delivery_config.get("album_mode", True)
+    album_size = min(MAX_ALBUM_SIZE, max(1, delivery_config.get("album_size", MAX_ALBUM_SIZE)))
+    # Isi album ditahan di memori sampai dikirim; batasi totalnya agar video besar tidak menumpuk
+    album_max_bytes = delivery_config.get("album_max_mb", 50) * 1024 * 1024
+    transport = delivery_config.get("transport", "stream")
+    if transport not in TRANSPORTS:
+        logger.warning("Unknown delivery transport '%s', using 'stream'", transport)
+        transport = "stream"
+
+    # Antrean berisi task unduhan sesuai urutan; ukurannya membatasi unduhan yang berjalan di depan
+    queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+    pending_tasks = set()  # Task yang belum dikonsumsi; yang sudah selesai dilepas agar isinya tidak tertahan
+
+    async def produce():
+        idx = 0
+        try:
+            async for item in iterate(items):
+                idx += 1
+                task = asyncio.create_task(prepare_item(item, caption_for(idx, item), client, config, transport))
+                pending_tasks.add(task)
+                await queue.put(task)
+        except Exception:
+            await queue.put(None)  # Item sebelumnya tetap dikirim, lalu error muncul lewat `await producer`
+            raise
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    sent_count = 0
+    batch: List[PreparedItem] = []
+    batch_bytes = 0
+
+    async def finished(done: List[PreparedItem]) -> int:
+        if on_delivered and done:
+            # Callback biasanya menulis checkpoint/watermark ke SQLite
+            await asyncio.to_thread(on_delivered, [prepared.item for prepared in done])
+        return sum(1 for prepared in done if not prepared.oversized)
+
+    try:
+        while True:
+            task = await queue.get()
+            if task is None:
+                break
+            prepared = await task
+            pending_tasks.discard(task)
+            if prepared is None:
+                continue
+            if prepared.oversized:
+                # Kirim album yang tertunda dulu agar urutan pesan tetap sama
+                if batch:
+                    sent_count += await finished(await send_album(query, batch, client, config, transport))
+                    batch, batch_bytes = [], 0
+                await query.message.reply_text("⚠️ File melebihi batas ukuran")
+                await finished([prepared])  # Tidak dihitung sebagai terkirim
+                continue
+
+            if not album_mode:
+                sent_count += await finished(await send_single(query, prepared, client, config, transport))
+                continue
+            size = len(prepared.media) if prepared.source == "bytes" else 0
+            if batch and batch_bytes + size > album_max_bytes:
+                sent_count += await finished(await send_album(query, batch, client, config, transport))
+                batch, batch_bytes = [], 0
+            batch.append(prepared)
+            batch_bytes += size
+            if len(batch) >= album_size:
+                sent_count += await finished(await send_album(query, batch, client, config, transport))
+                batch, batch_bytes = [], 0
+
+        if batch:
+            sent_count += await finished(await send_album(query, batch, client, config, transport))
+        await producer  # Munculkan error dari stream item, jika ada
+        return sent_count
+    finally:
+        producer.cancel()
+        for task in pending_tasks:
+            task.cancel()
+        await asyncio.gather(producer, *pending_tasks, return_exceptions=True)
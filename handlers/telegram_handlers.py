@@ -1,89 +1,214 @@
+import asyncio
 import re
-时尚from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import secrets
+from typing import List, Optional
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from handlers.instagram_handlers import (
     handle_profile_pic, handle_stories, handle_highlights, handle_highlight_items,
-    handle_profile_info
+    handle_profile_info, stop_highlight_items, handle_batch_stories, highlight_control_keyboard
 )
+from utils.async_client import ExecutorBusyError
+from utils.callback_utils import (
+    encode_callback, decode_callback,
+    PROFILE_PIC, STORY, HIGHLIGHTS, HIGHLIGHT_ITEMS, PROFILE_INFO, RESUME_HIGHLIGHT, STOP_HIGHLIGHT,
+    PROFILE_MENU, BATCH_STORIES, STORY_ALL
+)
+from utils.scheduler import get_scheduler, SchedulerBusyError, DeadlineExceededError
+from utils.state_store import get_state_store
 from utils.logging_utils import setup_logging, log_errors
+from utils.metrics import REGISTRY, timed
 
 logger = setup_logging()
 
+USERNAME_PATTERN = re.compile(r"[A-Za-z0-9_.]{1,30}")
+MAX_STORED_BATCHES = 5
+# Aksi ringan tidak lewat scheduler; Stop harus bisa jalan walau job yang dihentikan memakai slot pengguna
+UNSCHEDULED_ACTIONS = (STOP_HIGHLIGHT, PROFILE_MENU)
+DELIVERY_ACTIONS = (STORY, STORY_ALL, HIGHLIGHT_ITEMS, RESUME_HIGHLIGHT, BATCH_STORIES)
+
 @log_errors(logger)
+@timed("instbot_handler_seconds", label="handler")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict):
     lang = update.effective_user.language_code or config["default_language"]
-    logger.info(f"Sending start message to user {update.effective_user.id}")
+    logger.info("Sending start message to user %s", update.effective_user.id)
     await update.message.reply_text(config["languages"][lang]["start"])
 
+def profile_menu(username: str) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("📷 Foto Profil", callback_data=encode_callback(PROFILE_PIC, username)),
+            InlineKeyboardButton("📹 Story", callback_data=encode_callback(STORY, username))
+        ],
+        [
+            InlineKeyboardButton("🌟 Highlights", callback_data=encode_callback(HIGHLIGHTS, username, 0)),
+            InlineKeyboardButton("📊 Info Profil", callback_data=encode_callback(PROFILE_INFO, username))
+        ]
+    ])
+
+def batch_menu(batch_id: str, usernames: List[str]) -> InlineKeyboardMarkup:
+    keyboard = [[
+        InlineKeyboardButton(f"📹 Story semua ({len(usernames)})", callback_data=encode_callback(BATCH_STORIES, batch_id))
+    ]]
+    for username in usernames:
+        keyboard.append([InlineKeyboardButton(f"👤 @{username}", callback_data=encode_callback(PROFILE_MENU, username))])
+    return InlineKeyboardMarkup(keyboard)
+
 @log_errors(logger)
+@timed("instbot_handler_seconds", label="handler")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict, client):
     lang = update.effective_user.language_code or config["default_language"]
-    url = update.message.text.strip()
-    logger.info(f"Received message from user {update.effective_user.id}: {url}")
-    username = extract_username(url)
+    text = update.message.text.strip()
+    logger.info("Received message from user %s: %s", update.effective_user.id, text)
+    usernames = extract_usernames(text)
 
-    if not username:
-        logger.warning(f"Invalid URL received: {url}")
+    if not usernames:
+        logger.warning("Invalid URL received: %s", text)
         await update.message.reply_text(config["languages"][lang]["invalid_url"])
         return
 
-    context.user_data['current_profile'] = username
-    keyboard = [
-        [
-            InlineKeyboardButton("📷 Foto Profil", callback_data='profile_pic'),
-            InlineKeyboardButton("📹 Story", callback_data='story')
-        ],
-        [
-            InlineKeyboardButton("🌟 Highlights", callback_data='highlights'),
-            InlineKeyboardButton("📊 Info Profil", callback_data='profile_info')
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    logger.info(f"Sending feature menu for {username}")
-    await update.message.reply_text(f"Pilih fitur untuk @{username}:", reply_markup=reply_markup)
+    store = get_state_store(config)
+    if len(usernames) == 1:
+        username = usernames[0]
+        await asyncio.to_thread(store.update, update.effective_user.id, current_profile=username)
+        logger.info("Sending feature menu for %s", username)
+        await update.message.reply_text(f"Pilih fitur untuk @{username}:", reply_markup=profile_menu(username))
+        return
+
+    max_profiles = config.get("batch", {}).get("max_profiles", 10)
+    if len(usernames) > max_profiles:
+        logger.info("Truncating batch of %s profiles to %s", len(usernames), max_profiles)
+        usernames = usernames[:max_profiles]
+    # Daftar username terlalu panjang untuk callback_data (64 byte); simpan di state dengan ID pendek
+    batch_id = secrets.token_hex(4)
+    state = await asyncio.to_thread(store.get, update.effective_user.id)
+    batches = state.get("batches", {})
+    batches[batch_id] = usernames
+    state["batches"] = dict(list(batches.items())[-MAX_STORED_BATCHES:])
+    await asyncio.to_thread(store.set, update.effective_user.id, state)
+    logger.info("Sending batch menu for %s profiles", len(usernames))
+    await update.message.reply_text(
+        f"Ditemukan {len(usernames)} profil: {', '.join('@' + username for username in usernames)}",
+        reply_markup=batch_menu(batch_id, usernames)
+    )
 
 @log_errors(logger)
+@timed("instbot_handler_seconds", label="handler")
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict, client):
     query = update.callback_query
     await query.answer()
-    logger.info(f"Received callback query: {query.data} from user {query.from_user.id}")
+    logger.info("Received callback query: %s from user %s", query.data, query.from_user.id)
 
     lang = update.effective_user.language_code or config["default_language"]
-    username = context.user_data.get('current_profile')
+    store = get_state_store(config)
+    action, username, arg = decode_callback(query.data)
     if not username:
+        # Payload lama tanpa username: ambil profil aktif dari state store
+        username = (await asyncio.to_thread(store.get, query.from_user.id)).get('current_profile')
+    if action == BATCH_STORIES:
+        usernames = (await asyncio.to_thread(store.get, query.from_user.id)).get("batches", {}).get(username)
+        if not usernames:
+            logger.warning("Batch %s not found for user %s", username, query.from_user.id)
+            await query.edit_message_text("❌ Session expired, silakan kirim URL lagi")
+            return
+    if not action or not username:
         logger.warning("Session expired, no current_profile found")
         await query.edit_message_text("❌ Session expired, silakan kirim URL lagi")
         return
 
-    try:
-        if query.data == 'profile_pic':
+    async def dispatch():
+        if action == PROFILE_PIC:
             await handle_profile_pic(query, username, client, config, lang)
-        elif query.data == 'story':
+        elif action == STORY:
             await handle_stories(query, username, client, config, lang)
-        elif query.data == 'highlights':
-            await handle_highlights(query, username, client, config, lang)
-        elif query.data.startswith('highlights_next_'):
-            next_page = int(query.data.split('_')[2])
-            await handle_highlights(query, username, client, config, lang, page=next_page)
-        elif query.data.startswith('highlights_prev_'):
-            prev_page = int(query.data.split('_')[2])
-            await handle_highlights(query, username, client, config, lang, page=prev_page)
-        elif query.data.startswith('highlight_'):
-            highlight_id = query.data.split('_')[1]
-            await handle_highlight_items(query, username, highlight_id, client, config, lang)
-        elif query.data == 'profile_info':
+        elif action == STORY_ALL:
+            await handle_stories(query, username, client, config, lang, send_all=True)
+        elif action == HIGHLIGHTS:
+            page = int(arg or 0)
+            await asyncio.to_thread(store.update, query.from_user.id, current_profile=username, highlights_page=page)
+            await handle_highlights(query, username, client, config, lang, page=page)
+        elif action == HIGHLIGHT_ITEMS:
+            await handle_highlight_items(query, username, arg, client, config, lang)
+        elif action == RESUME_HIGHLIGHT:
+            await handle_highlight_items(query, username, arg, client, config, lang, resume=True)
+        elif action == STOP_HIGHLIGHT:
+            await stop_highlight_items(query, arg)
+        elif action == PROFILE_INFO:
             await handle_profile_info(query, username, client, config, lang)
+        elif action == PROFILE_MENU:
+            await asyncio.to_thread(store.update, query.from_user.id, current_profile=username)
+            await query.message.reply_text(f"Pilih fitur untuk @{username}:", reply_markup=profile_menu(username))
+        elif action == BATCH_STORIES:
+            await handle_batch_stories(query, usernames, client, config, lang)
+
+    try:
+        if action in UNSCHEDULED_ACTIONS:
+            await dispatch()
+        else:
+            await get_scheduler(config).run(query.from_user.id, dispatch(), job_deadline(action, config))
+    except (ExecutorBusyError, SchedulerBusyError):
+        logger.warning("Bot busy, rejecting callback %s", query.data)
+        await query.message.reply_text(config["languages"][lang]["busy"])
+    except DeadlineExceededError as e:
+        logger.warning("Callback %s from user %s timed out: %s", query.data, query.from_user.id, e)
+        reply_markup = None
+        if action in (HIGHLIGHT_ITEMS, RESUME_HIGHLIGHT):
+            # Item yang sudah terkirim tercatat di checkpoint; tawarkan untuk melanjutkan
+            reply_markup = highlight_control_keyboard(RESUME_HIGHLIGHT, username, arg)
+        await query.message.reply_text(config["languages"][lang]["timeout"], reply_markup=reply_markup)
     except Exception as e:
-        logger.error(f"Failed to process callback {query.data}: {str(e)}")
+        logger.error("Failed to process callback %s: %s", query.data, e)
         await query.edit_message_text(config["languages"][lang]["error"])
 
-def extract_username(url: str) -> str:
-    logger.debug(f"Extracting username from URL: {url}")
+def job_deadline(action: str, config: dict) -> float:
+    """Batas waktu end-to-end job; pengiriman media banyak item diberi waktu lebih panjang."""
+    scheduler_config = config.get("scheduler", {})
+    if action in DELIVERY_ACTIONS:
+        return scheduler_config.get("delivery_deadline_seconds", 600)
+    return scheduler_config.get("deadline_seconds", 120)
+
+@log_errors(logger)
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE, config: dict):
+    if update.effective_user.id not in config.get("admin_ids", []):
+        logger.warning("User %s is not allowed to use /stats", update.effective_user.id)
+        return
+    logger.info("Sending stats to admin %s", update.effective_user.id)
+    summary = REGISTRY.render_summary()
+    await update.message.reply_text(summary[:4000])  # Batas panjang pesan Telegram
+
+def extract_usernames(text: str) -> List[str]:
+    """Ambil semua username dari pesan tanpa duplikat.
+
+    URL profil dan @username selalu dikenali. Username polos hanya dipakai jika pesan tidak
+    memuat keduanya dan berupa satu kata atau daftar (satu per baris atau dipisah koma), agar
+    kalimat biasa tidak dianggap daftar profil.
+    """
+    entries = [entry for entry in re.split(r"[\n,;]+", text) if entry.strip()]
+    is_list = all(len(entry.split()) == 1 for entry in entries)
+    explicit, bare = [], []
+    for token in re.split(r"[\s,;]+", text):
+        if "instagram.com" in token.lower():
+            explicit.append(extract_username(token))
+        elif token.startswith("@"):
+            explicit.append(token[1:] if USERNAME_PATTERN.fullmatch(token[1:]) else None)
+        elif USERNAME_PATTERN.fullmatch(token):
+            bare.append(token)
+
+    usernames, seen = [], set()
+    for username in (explicit if any(explicit) else bare if is_list else []):
+        if username and username.lower() not in seen:
+            seen.add(username.lower())
+            usernames.append(username)
+    return usernames
+
+def extract_username(url: str) -> Optional[str]:
+    logger.debug("Extracting username from URL: %s", url)
     match = re.match(
         r"(?:https?://)?(?:www\.)?instagram\.com/([a-zA-Z0-9_.]+)/?",
         url,
         re.IGNORECASE
     )
-    username = match.group(1) if match else None
-    logger.debug(f"Extracted username: {username}")
+    # Aturan yang sama dengan @username: 1-30 karakter
+    username = match.group(1) if match and USERNAME_PATTERN.fullmatch(match.group(1)) else None
+    logger.debug("Extracted username: %s", username)
     return username
@@ -1,3 +1,6 @@
+import time
+STARTED_AT = time.perf_counter()  # Sebelum import berat, agar waktu startup ikut menghitungnya
+import asyncio
 import json
 import os
 from telegram.ext import (
@@ -9,50 +12,136 @@ from telegram.ext import (
     CallbackQueryHandler
 )
 from dotenv import load_dotenv
-from utils.logging_utils import setup_logging
+from utils.logging_utils import setup_logging, configure_logging
 from utils.instagram_utils import InstagramClient
-from handlers.telegram_handlers import start, handle_message, button_handler
+from utils.async_client import AsyncInstagramClient
+from utils.metrics import REGISTRY, start_metrics_server
+from handlers.telegram_handlers import start, handle_message, button_handler, stats
 
 load_dotenv()
-logger = setup_logging(logging.DEBUG)
+logger = setup_logging()
 
 # Load Configuration
-logger.debug("Loading configuration from config.json")
 with open("config/config.json", "r", encoding="utf-8") as f:
     CONFIG = json.load(f)
-logger.info("Configuration loaded successfully")
 
 # Load Environment Variables
 REQUIRED_ENV_VARS = ['TOKEN_BOT', 'INSTAGRAM_USERNAME', 'INSTAGRAM_PASSWORD']
-env_vars = {var: os.getenv(var).strip('"').strip("'") if os.getenv(var) else None for var in REQUIRED_ENV_VARS}
 
-if any(value is None for value in env_vars.values()):
-    missing = [var for var, val in env_vars.items() if val is None]
-    logger.error(f"Missing .env variables: {', '.join(missing)}")
-    exit(1)
-logger.info("All required environment variables loaded")
+def load_env_vars() -> dict:
+    env_vars = {var: os.getenv(var).strip('"').strip("'") if os.getenv(var) else None for var in REQUIRED_ENV_VARS}
+    if any(value is None for value in env_vars.values()):
+        missing = [var for var, val in env_vars.items() if val is None]
+        logger.error("Missing .env variables: %s", ', '.join(missing))
+        exit(1)
+    logger.info("All required environment variables loaded")
+    return env_vars
 
 # Initialize Instagram Client
-logger.debug("Initializing Instagram client")
-client = InstagramClient(env_vars)
-if not client.validate_session():
-    logger.error("Initial session validation failed after login")
-    admin_chat_id = "YOUR_ADMIN_CHAT_ID"  # Ganti dengan ID chat Anda
-    app = Application.builder().token(env_vars['TOKEN_BOT']).build()
-    app.bot.send_message(chat_id=admin_chat_id, text="⚠️ Gagal login ke Instagram. Periksa username dan password di .env.")
-    exit(1)
-logger.info(f"Instagram login successful as {client.username}")
+def create_client(env_vars: dict, config: dict = CONFIG) -> AsyncInstagramClient:
+    logger.debug("Initializing Instagram client")
+    try:
+        client = InstagramClient(env_vars, config)  # Dengan startup.defer_login hanya memuat file sesi
+    except RuntimeError as e:
+        logger.error("Initial Instagram login failed: %s", e)
+        exit(1)
+    if client.session_health.is_trusted():
+        logger.info("Instagram login successful as %s", client.username)
+    return AsyncInstagramClient(client, config)
 
-# Main Function
-def main():
+def log_startup(what: str):
+    elapsed = time.perf_counter() - STARTED_AT
+    REGISTRY.set_gauge("instbot_startup_seconds", elapsed, phase="telegram")
+    logger.info("%s ready in %.2fs after process start", what, elapsed)
+
+def build_application(env_vars: dict, async_client: AsyncInstagramClient, with_updater: bool = True,
+                      config: dict = CONFIG) -> Application:
     logger.debug("Building Telegram application")
-    application = Application.builder().token(env_vars['TOKEN_BOT']).build()
+
+    async def start_client(application: Application):
+        async_client.start_background()
+        log_startup("Telegram application")
+
+    async def shutdown_client(application: Application):
+        await async_client.shutdown()
+
+    builder = (
+        Application.builder()
+        .token(env_vars['TOKEN_BOT'])
+        .concurrent_updates(True)
+        .post_init(start_client)
+        .post_shutdown(shutdown_client)
+    )
+    if config.get("telegram_base_url"):
+        # Dipakai untuk menguji bot terhadap server Telegram tiruan (benchmarks/fake_bot_server.py)
+        builder = builder.base_url(config["telegram_base_url"])
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Add Handlers
-    application.add_handler(CommandHandler("start", lambda u, c: start(u, c, CONFIG)))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lambda u, c: handle_message(u, c, CONFIG, client)))
-    application.add_handler(CallbackQueryHandler(lambda u, c: button_handler(u, c, CONFIG, client)))
+    application.add_handler(CommandHandler("start", lambda u, c: start(u, c, config)))
+    application.add_handler(CommandHandler("stats", lambda u, c: stats(u, c, config)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lambda u, c: handle_message(u, c, config, async_client)))
+    application.add_handler(CallbackQueryHandler(lambda u, c: button_handler(u, c, config, async_client)))
+    return application
+
+def webhook_worker(index: int, update_queue, env_vars: dict, config: dict):
+    """Proses worker webhook: punya InstagramClient dan Application sendiri.
+
+    config berasal dari worker_config: bagian rate limit per worker, dan sesi hanya dimuat dari file.
+    """
+    from utils.webhook_utils import process_updates
+    configure_logging(config)  # Thread listener log tidak ikut ke proses anak
+    logger.info("Starting webhook worker %s", index)
+    start_metrics_server(config, port_offset=index + 1)
+    async_client = create_client(env_vars, config)
+    application = build_application(env_vars, async_client, with_updater=False, config=config)
+
+    async def run():
+        async_client.start_background()  # post_init hanya dipanggil oleh run_polling/run_webhook
+        log_startup(f"Webhook worker {index}")
+        try:
+            await process_updates(application, update_queue)
+        finally:
+            await async_client.shutdown()
+
+    asyncio.run(run())
+
+def login_once(env_vars: dict):
+    """Login (atau validasi sesi tersimpan) sekali di proses induk, sebelum worker dibuat."""
+    config = dict(CONFIG, startup=dict(CONFIG.get("startup", {}), defer_login=False))
+    try:
+        InstagramClient(env_vars, config)
+    except RuntimeError as e:
+        logger.error("Initial Instagram login failed: %s", e)
+        exit(1)
+    logger.info("Instagram session ready for webhook workers")
+
+def run_webhook(env_vars: dict):
+    from utils.webhook_utils import WebhookDispatcher, register_webhook, webhook_secret, worker_config
+    if not webhook_secret(CONFIG):
+        logger.error("WEBHOOK_SECRET_TOKEN is not set; refusing to accept unauthenticated webhook updates")
+        exit(1)
+    asyncio.run(register_webhook(env_vars['TOKEN_BOT'], CONFIG, CONFIG.get("telegram_base_url") or None))
+    # Worker hanya memuat file sesi; N proses yang login bersamaan terlihat mencurigakan bagi Instagram
+    login_once(env_vars)
+    dispatcher = WebhookDispatcher(CONFIG, webhook_worker, worker_args=(env_vars, worker_config(CONFIG)))
+    logger.info("Bot started successfully in webhook mode")
+    dispatcher.serve_forever()
+
+# Main Function
+def main():
+    configure_logging(CONFIG)
+    logger.info("Configuration loaded successfully")
+    env_vars = load_env_vars()
+    mode = os.getenv("BOT_MODE", CONFIG.get("mode", "polling")).lower()
+    if mode == "webhook":
+        run_webhook(env_vars)
+        return
 
+    start_metrics_server(CONFIG)
+    application = build_application(env_vars, create_client(env_vars))
     logger.info("Bot started successfully")
     application.run_polling()
 
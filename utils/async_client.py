@@ -0,0 +1,291 @@
+import asyncio
+import functools
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import httpx
+from instaloader import Profile
+from utils.instagram_utils import InstagramClient, HighlightIndex
+from utils.http_utils import MediaTooLargeError
+from utils.singleflight import SingleFlight
+from utils.cache import TTLCache
+from utils.prefetch import StoryPrefetcher
+from utils.metrics import REGISTRY, timed, timer
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class ExecutorBusyError(RuntimeError):
+    """Dilempar saat antrean worker Instagram sudah penuh."""
+
+class AsyncInstagramClient:
+    """Fasad async untuk InstagramClient; semua panggilan blocking dijalankan di thread pool terbatas."""
+
+    def __init__(self, client: InstagramClient, config: dict):
+        executor_config = config.get("executor", {})
+        self.client = client
+        self.client.paced_by_caller = True
+        self.max_workers = executor_config.get("max_workers", 4)
+        self.queue_depth = executor_config.get("queue_depth", 32)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="instagram"
+        )
+        self.pending = 0  # Jumlah job yang sedang berjalan atau menunggu worker
+        self.max_media_bytes = config.get("max_file_size_mb", 50) * 1024 * 1024
+        self.ready_timeout = config.get("startup", {}).get("ready_timeout", 30)
+        self._ready: Optional[asyncio.Task] = None  # Validasi sesi awal; dibuat oleh start_background
+        self.singleflight = SingleFlight()
+        prefetch_config = config.get("prefetch", {})
+        # Hanya berisi media yang dihangatkan prefetch; unduhan biasa tidak disimpan. Dibatasi
+        # total byte, dan item di atas media_cache_item_mb (video besar) tidak ikut disimpan
+        self.media_cache = TTLCache(
+            "media",
+            max_size=prefetch_config.get("media_cache_size", 64),
+            ttl=prefetch_config.get("media_ttl", 600),
+            max_bytes=int(prefetch_config.get("media_cache_mb", 256) * 1024 * 1024)
+        )
+        self.media_cache_item_bytes = int(prefetch_config.get("media_cache_item_mb", 16) * 1024 * 1024)
+        self.prefetcher = StoryPrefetcher(self, config)
+        REGISTRY.register_collector(self.collect_metrics, loop_owned=True)
+        logger.info("Instagram executor ready: %s workers, queue depth %s", self.max_workers, self.queue_depth)
+
+    @property
+    def username(self) -> str:
+        return self.client.username
+
+    def collect_metrics(self):
+        yield "instbot_instagram_ready", {}, int(self._ready is None or self._ready.done())
+        yield "instbot_executor_pending", {}, self.pending
+        yield "instbot_executor_workers", {}, self.max_workers
+        yield "instbot_singleflight_in_flight", {}, self.singleflight.in_flight()
+        yield "instbot_singleflight_coalesced", {}, self.singleflight.coalesced
+        for cache_name, stats in self.cache_stats().items():
+            yield "instbot_cache_size", {"cache": cache_name}, stats["size"]
+            yield "instbot_cache_hit_rate", {"cache": cache_name}, stats["hit_rate"]
+        rate = self.rate_stats()
+        yield "instbot_rate_requests_per_minute", {}, rate["requests_per_minute"]
+        yield "instbot_rate_available_tokens", {}, rate["available_tokens"]
+        yield "instbot_rate_throttles", {}, rate["throttles"]
+
+    async def wait_ready(self):
+        """Tunggu validasi sesi awal selesai, paling lama ready_timeout detik."""
+        if self._ready is None or self._ready.done():
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self._ready), self.ready_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Instagram session not ready after %ss, continuing anyway", self.ready_timeout)
+
+    async def _warm_up(self) -> bool:
+        """Validasi (dan bila perlu login ulang) sesi di latar, tanpa menahan start Telegram."""
+        if self.client.session_health.is_trusted():
+            return True  # Sudah divalidasi saat login langsung
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.client.ensure_valid_session)
+        except Exception as e:
+            # Request berikutnya akan mencoba login lagi lewat ensure_valid_session
+            logger.error("Background Instagram login failed: %s", e)
+            return False
+        elapsed = time.perf_counter() - started
+        REGISTRY.set_gauge("instbot_startup_seconds", elapsed, phase="instagram_session")
+        logger.info("Instagram session ready in %.2fs as %s", elapsed, self.username)
+        return True
+
+    async def pace(self):
+        """Jeda antar request Instagram (token governor, jitter, kunjungan dummy) tanpa menahan worker thread."""
+        governor = self.client.governor
+        with timer("instbot_pacing_seconds"):
+            await governor.acquire_async()
+            # Jitter kecil agar pola request tidak terlalu teratur (Saran 1)
+            if self.client.jitter_seconds > 0:
+                await governor.async_sleep(random.uniform(0, self.client.jitter_seconds))
+
+        # Simulasi kunjungan dummy ke halaman lain (Saran 5)
+        if random.random() < self.client.dummy_visit_chance:
+            logger.debug("Simulating dummy visit to Instagram homepage")
+            await governor.acquire_async()
+            try:
+                await self.client.http.async_client.get(
+                    "https://www.instagram.com/", headers=self.client.get_random_headers()
+                )
+            except httpx.HTTPError as e:
+                logger.debug("Dummy visit failed: %s", e)
+
+    async def run(self, func: Callable, *args, paced: bool = True, **kwargs) -> Any:
+        """Jalankan fungsi blocking di executor tanpa menahan event loop.
+
+        paced=True mengambil token governor lebih dulu di event loop, sehingga cooldown 429 atau
+        kekurangan token tidak memarkir worker; pakai paced=False untuk fungsi tanpa request Instagram.
+        """
+        await self.wait_ready()
+        if self.pending >= self.max_workers + self.queue_depth:
+            logger.warning("Instagram executor saturated (%s pending), rejecting %s", self.pending, func.__name__)
+            raise ExecutorBusyError("Instagram worker queue is full")
+
+        self.pending += 1
+        try:
+            if paced:
+                await self.pace()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    # Cache dibaca langsung di event loop; hanya miss yang menunggu readiness, governor dan worker
+    async def get_profile(self, username: str) -> Profile:
+        profile = self.client.profile_cache.get(username.lower())
+        if profile is not None:
+            return profile
+        return await self.singleflight.do(
+            ("profile", username.lower()),
+            lambda: self.run(self.client.fetch_profile, username)
+        )
+
+    def cache_stats(self) -> Dict[str, Dict]:
+        return {**self.client.cache_stats(), "media": self.media_cache.stats()}
+
+    def rate_stats(self) -> Dict[str, float]:
+        return self.client.rate_stats()
+
+    async def get_stories_by_user(self, user_ids: List[int], refresh: bool = False) -> Dict[int, List]:
+        cached = {} if refresh else {userid: self.client.story_cache.get(userid) for userid in user_ids}
+        missing = [userid for userid in user_ids if cached.get(userid) is None]
+        if missing:
+            cached.update(await self.singleflight.do(
+                ("stories", tuple(sorted(missing))),
+                lambda: self.run(self.client.fetch_stories_by_user, missing)
+            ))
+        return {userid: cached.get(userid) or [] for userid in user_ids}
+
+    async def get_stories(self, user_ids: List[int], refresh: bool = False) -> List:
+        by_user = await self.get_stories_by_user(user_ids, refresh)
+        return [item for userid in user_ids for item in by_user.get(userid, [])]
+
+    async def get_highlight_index(self, profile: Profile) -> HighlightIndex:
+        index = self.client.highlight_cache.get(profile.userid)
+        if index is not None:
+            return index
+        return await self.singleflight.do(
+            ("highlights", profile.userid),
+            lambda: self.run(self.client.fetch_highlight_index, profile)
+        )
+
+    async def get_highlights(self, profile: Profile) -> List:
+        return (await self.get_highlight_index(profile)).highlights
+
+    async def get_highlight(self, profile: Profile, unique_id: int):
+        return (await self.get_highlight_index(profile)).get(unique_id)
+
+    async def open_highlight_stream(self, highlight, chunk_size: int = 5) -> Tuple[int, AsyncIterator]:
+        """Buka item highlight di worker; kembalikan (jumlah item, async iterator item)."""
+        iterator, chunk, total = await self.run(self.client.open_highlight_items, highlight, chunk_size)
+        return total, self._iterate_chunks(iterator, chunk, chunk_size)
+
+    async def _iterate_chunks(self, iterator, chunk: List, chunk_size: int) -> AsyncIterator:
+        # get_items instaloader mengambil semua item dalam satu request saat dibuka; potongan
+        # berikutnya hanya islice di memori, jadi tidak dikenai token governor maupun jitter
+        while chunk:
+            for item in chunk:
+                yield item
+            chunk = await self.run(self.client.next_items, iterator, chunk_size, paced=False)
+
+    async def stream_highlight_items(self, highlight, chunk_size: int = 5) -> AsyncIterator:
+        """Hasilkan item highlight satu per satu; tiap potongan diambil di worker saat dibutuhkan."""
+        _, items = await self.open_highlight_stream(highlight, chunk_size)
+        async for item in items:
+            yield item
+
+    async def get_profile_pic_url(self, profile: Profile) -> str:
+        return await self.run(self.client.get_profile_pic_url, profile)
+
+    async def download_storyitem(self, item, target: str):
+        return await self.run(self.client.download_storyitem, item, target)
+
+    async def resolve_media_urls(self, item) -> List[str]:
+        return await self.singleflight.do(
+            ("media_url", item.mediaid),
+            lambda: self.run(self.client.resolve_media_urls, item, paced=False)
+        )
+
+    async def resolve_media_url(self, item) -> str:
+        return (await self.resolve_media_urls(item))[0]
+
+    @timed("instbot_instagram_seconds")
+    async def fetch_media(self, item, keep: bool = False) -> bytes:
+        """Ambil isi media dari CDN lewat pool HTTP async, tanpa memakai worker thread.
+
+        keep=True menyimpan hasilnya di media_cache (dipakai prefetch). Varian yang melebihi
+        max_file_size_mb dilewati tanpa diunduh penuh; MediaTooLargeError jika tidak ada yang muat.
+        """
+        data = self.media_cache.get(item.mediaid)
+        if data is not None:
+            logger.debug("Serving story item %s from prefetched media", item.mediaid)
+            return data
+
+        async def fetch() -> bytes:
+            urls = await self.resolve_media_urls(item)
+            too_large = None
+            for url in urls:
+                logger.debug("Streaming story item %s from CDN", item.mediaid)
+                await self.client.governor.acquire_async()
+                try:
+                    data = await self.client.http.fetch_bytes(
+                        url, headers=self.client.get_random_headers(), max_bytes=self.max_media_bytes
+                    )
+                except MediaTooLargeError as e:
+                    self.client.governor.on_success()
+                    REGISTRY.inc("instbot_oversized_media_total", stage=e.stage)
+                    logger.info("Variant of item %s skipped: %s", item.mediaid, e)
+                    too_large = e
+                    continue
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code == 429:
+                        self.client.governor.on_throttle()
+                    raise
+                self.client.governor.on_success()
+                REGISTRY.inc("instbot_downloaded_bytes_total", len(data), kind="media")
+                logger.info("Story item %s fetched (%s bytes)", item.mediaid, len(data))
+                return data
+            raise too_large
+
+        data = await self.singleflight.do(("media", item.mediaid), fetch)
+        if keep and len(data) <= self.media_cache_item_bytes:
+            self.media_cache.set(item.mediaid, data)
+        return data
+
+    @timed("instbot_instagram_seconds")
+    async def fetch_profile_pic(self, url: str, etag: Optional[str] = None,
+                                last_modified: Optional[str] = None) -> httpx.Response:
+        """Ambil foto profil; dengan validator dari cache, jawaban 304 tidak membawa isi file."""
+        logger.debug("Fetching profile picture from URL: %s", url)
+        await self.client.governor.acquire_async()
+        response = await self.client.http.get_conditional(
+            url, headers=self.client.get_random_headers(), etag=etag, last_modified=last_modified
+        )
+        REGISTRY.inc("instbot_profile_pic_requests_total", status=str(response.status_code))
+        if response.status_code == 304:
+            logger.info("Profile picture not modified")
+            return response
+        REGISTRY.inc("instbot_downloaded_bytes_total", len(response.content), kind="profile_pic")
+        logger.info("Profile picture downloaded (%s bytes)", len(response.content))
+        return response
+
+    def start_background(self):
+        """Mulai tugas latar (validasi sesi, prefetch); harus dipanggil dari event loop yang sedang berjalan."""
+        REGISTRY.bind_loop(asyncio.get_running_loop())  # Collector metrik membaca state loop ini
+        if self._ready is None:
+            self._ready = asyncio.create_task(self._warm_up())
+        self.prefetcher.start()
+
+    async def shutdown(self):
+        if self._ready is not None and not self._ready.done():
+            self._ready.cancel()
+            await asyncio.gather(self._ready, return_exceptions=True)
+        await self.prefetcher.stop()
+        logger.info("Shutting down Instagram executor")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        await self.client.http.aclose()
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class TTLCache:
+    """Cache in-memory dengan batas ukuran (LRU) dan masa berlaku per entri.
+
+    max_bytes (opsional) membatasi total len() nilai yang disimpan, untuk cache berisi bytes.
+    """
+
+    def __init__(self, name: str, max_size: int = 256, ttl: Optional[float] = 600,
+                 max_bytes: Optional[int] = None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _weight(self, value: Any) -> int:
+        return len(value) if self.max_bytes is not None else 0
+
+    def _discard(self, key: Hashable) -> Optional[tuple]:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= self._weight(entry[1])
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        weight = self._weight(value)
+        with self._lock:
+            self._discard(key)
+            if self.max_bytes is not None and weight > self.max_bytes:
+                logger.debug("Cache %s skipped %s (%s bytes over budget)", self.name, key, weight)
+                return
+            self._data[key] = (expires_at, value)
+            self.bytes += weight
+            while len(self._data) > self.max_size or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                evicted = next(iter(self._data))
+                self._discard(evicted)
+                self.evictions += 1
+                logger.debug("Cache %s evicted %s", self.name, evicted)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._discard(key)
+        return entry[1] if entry else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            **({"bytes": self.bytes, "max_bytes": self.max_bytes} if self.max_bytes is not None else {}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+        }
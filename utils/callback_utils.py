@@ -0,0 +1,42 @@
+from typing import Optional, Tuple
+
+# Payload callback ringkas: "<aksi>|<username>[|<argumen>]", maksimal 64 byte sesuai batas Telegram
+SEPARATOR = "|"
+PROFILE_PIC = "pp"
+STORY = "st"
+HIGHLIGHTS = "hl"
+HIGHLIGHT_ITEMS = "hi"
+PROFILE_INFO = "pi"
+RESUME_HIGHLIGHT = "rs"
+STOP_HIGHLIGHT = "sp"
+PROFILE_MENU = "pm"
+BATCH_STORIES = "bs"  # Slot username berisi ID batch dari state store
+STORY_ALL = "sa"  # Kirim ulang semua story, termasuk yang sudah pernah diterima
+
+# Payload lama sebelum username disertakan; tetap didukung untuk tombol yang sudah terkirim
+LEGACY_ACTIONS = {
+    "profile_pic": PROFILE_PIC,
+    "story": STORY,
+    "highlights": HIGHLIGHTS,
+    "profile_info": PROFILE_INFO,
+}
+
+def encode_callback(action: str, username: str, arg=None) -> str:
+    parts = [action, username] if arg is None else [action, username, str(arg)]
+    data = SEPARATOR.join(parts)
+    if len(data.encode("utf-8")) > 64:
+        raise ValueError(f"Callback data too long: {data}")
+    return data
+
+def decode_callback(data: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """Kembalikan (aksi, username, argumen); username None untuk payload lama."""
+    if SEPARATOR in data:
+        parts = data.split(SEPARATOR, 2)
+        return parts[0], parts[1], parts[2] if len(parts) > 2 else None
+    if data in LEGACY_ACTIONS:
+        return LEGACY_ACTIONS[data], None, None
+    if data.startswith(("highlights_next_", "highlights_prev_")):
+        return HIGHLIGHTS, None, data.rsplit("_", 1)[1]
+    if data.startswith("highlight_"):
+        return HIGHLIGHT_ITEMS, None, data.split("_", 1)[1]
+    return None, None, None
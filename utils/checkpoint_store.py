@@ -0,0 +1,72 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Set
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class CheckpointStore:
+    """Catatan item yang sudah terkirim per (pengguna, highlight), agar pengiriman bisa dilanjutkan."""
+
+    def __init__(self, path: str, ttl: float = 604800):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS delivery_checkpoints ("
+            "user_id INTEGER NOT NULL, job_key TEXT NOT NULL, media_key TEXT NOT NULL, "
+            "delivered_at REAL NOT NULL, PRIMARY KEY (user_id, job_key, media_key))"
+        )
+        self._conn.commit()
+        logger.info("Delivery checkpoint store opened at %s", path)
+
+    def delivered(self, user_id: int, job_key) -> Set[str]:
+        """Kembalikan mediaid yang sudah terkirim untuk job ini (kosong jika kedaluwarsa)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT media_key FROM delivery_checkpoints "
+                "WHERE user_id = ? AND job_key = ? AND delivered_at >= ?",
+                (user_id, str(job_key), time.time() - self.ttl if self.ttl else 0)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark(self, user_id: int, job_key, media_keys: Iterable):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO delivery_checkpoints (user_id, job_key, media_key, delivered_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(user_id, str(job_key), str(media_key), now) for media_key in media_keys]
+            )
+            self._conn.commit()
+
+    def clear(self, user_id: int, job_key):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM delivery_checkpoints WHERE user_id = ? AND job_key = ?", (user_id, str(job_key))
+            )
+            if self.ttl:
+                self._conn.execute(
+                    "DELETE FROM delivery_checkpoints WHERE delivered_at < ?", (time.time() - self.ttl,)
+                )
+            self._conn.commit()
+
+_checkpoint_store: Optional[CheckpointStore] = None
+
+def get_checkpoint_store(config: dict) -> CheckpointStore:
+    """Ambil instance CheckpointStore bersama, dibuat saat pertama kali dipakai."""
+    global _checkpoint_store
+    if _checkpoint_store is None:
+        checkpoint_config = config.get("checkpoints", {})
+        _checkpoint_store = CheckpointStore(
+            checkpoint_config.get("path", "data/checkpoints.sqlite3"),
+            ttl=checkpoint_config.get("ttl", 604800)
+        )
+    return _checkpoint_store
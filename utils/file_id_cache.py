@@ -0,0 +1,120 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from utils.logging_utils import setup_logging
+from utils.metrics import REGISTRY
+
+logger = setup_logging()
+
+class FileIdCache:
+    """Penyimpanan persisten mediaid Instagram -> file_id Telegram (SQLite)."""
+
+    def __init__(self, path: str, max_entries: int = 50000, touch_batch: int = 100):
+        self.path = path
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}  # Waktu pakai yang belum ditulis ke SQLite
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "media_key TEXT PRIMARY KEY, file_id TEXT NOT NULL, "
+            "media_type TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_file_ids_last_used ON file_ids (last_used)")
+        self._conn.commit()
+        logger.info("File ID cache opened at %s", path)
+
+    def get(self, media_key) -> Optional[Tuple[str, str]]:
+        """Kembalikan (file_id, media_type) jika ada; waktu pakainya ditulis bertahap, bukan per lookup."""
+        key = str(media_key)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id, media_type FROM file_ids WHERE media_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touches()
+            self.hits += 1
+            return row[0], row[1]
+
+    def contains(self, media_key) -> bool:
+        """Cek keberadaan tanpa mengubah statistik maupun urutan LRU."""
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM file_ids WHERE media_key = ?", (str(media_key),)).fetchone()
+        return row is not None
+
+    def _flush_touches(self):
+        # Dipanggil dengan _lock dipegang; satu transaksi untuk semua waktu pakai yang tertunda
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE file_ids SET last_used = ? WHERE media_key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()]
+        )
+        self._touched.clear()
+        self._conn.commit()
+
+    def set(self, media_key, file_id: str, media_type: str):
+        with self._lock:
+            self._flush_touches()  # Urutan LRU harus terkini sebelum eviction
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_ids (media_key, file_id, media_type, last_used) VALUES (?, ?, ?, ?)",
+                (str(media_key), file_id, media_type, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+            if count > self.max_entries:
+                # Buang entri yang paling lama tidak dipakai
+                self._conn.execute(
+                    "DELETE FROM file_ids WHERE media_key IN "
+                    "(SELECT media_key FROM file_ids ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+                logger.debug("Evicted %s entries from file ID cache", count - self.max_entries)
+            self._conn.commit()
+
+    def invalidate(self, media_key):
+        with self._lock:
+            self._touched.pop(str(media_key), None)
+            self._conn.execute("DELETE FROM file_ids WHERE media_key = ?", (str(media_key),))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        return {"size": size, "max_size": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+    def collect_metrics(self):
+        lookups = self.hits + self.misses
+        yield "instbot_cache_hit_rate", {"cache": "file_ids"}, round(self.hits / lookups, 3) if lookups else 0.0
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.close()
+
+_file_id_cache: Optional[FileIdCache] = None
+
+def get_file_id_cache(config: dict) -> FileIdCache:
+    """Ambil instance FileIdCache bersama, dibuat saat pertama kali dipakai."""
+    global _file_id_cache
+    if _file_id_cache is None:
+        cache_config = config.get("file_id_cache", {})
+        _file_id_cache = FileIdCache(
+            cache_config.get("path", "data/file_ids.sqlite3"),
+            max_entries=cache_config.get("max_entries", 50000),
+            touch_batch=cache_config.get("touch_batch", 100)
+        )
+        REGISTRY.register_collector(_file_id_cache.collect_metrics)
+    return _file_id_cache
@@ -9,26 +9,26 @@ logger = setup_logging()
 
 def get_latest_file(directory: str) -> Optional[str]:
     valid_extensions = ('.jpg', '.jpeg', '.png', '.mp4', '.mov')
-    logger.debug(f"Scanning directory {directory} for media files")
+    logger.debug("Scanning directory %s for media files", directory)
     media_files = [
         f for f in glob.glob(os.path.join(directory, "*"))
         if f.lower().endswith(valid_extensions)
     ]
     if not media_files:
-        logger.warning(f"No valid media files found in {directory}")
+        logger.warning("No valid media files found in %s", directory)
         return None
     latest_file = max(media_files, key=os.path.getmtime)
-    logger.debug(f"Latest file found: {latest_file}")
+    logger.debug("Latest file found: %s", latest_file)
     return latest_file
 
 def create_temp_dir(prefix: str) -> str:
     temp_dir = tempfile.mkdtemp(prefix=prefix)
-    logger.info(f"Created temporary directory: {temp_dir}")
+    logger.info("Created temporary directory: %s", temp_dir)
     return temp_dir
 
 def cleanup_temp_dir(directory: str):
     if os.path.exists(directory):
-        logger.info(f"Cleaning up temporary directory: {directory}")
+        logger.info("Cleaning up temporary directory: %s", directory)
         shutil.rmtree(directory)
     else:
-        logger.warning(f"Directory {directory} does not exist, skipping cleanup")
+        logger.warning("Directory %s does not exist, skipping cleanup", directory)
@@ -0,0 +1,88 @@
+from typing import Dict, Optional
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class MediaTooLargeError(Exception):
+    """Dilempar saat ukuran media melebihi batas, sebelum atau selama unduhan."""
+
+    def __init__(self, size: int, limit: int, stage: str):
+        super().__init__(f"media size {size} exceeds limit {limit} ({stage})")
+        self.size = size
+        self.limit = limit
+        self.stage = stage  # "header" (Content-Length), "stream" atau "disk"
+
+class HttpPool:
+    """Koneksi HTTP bersama (keep-alive) untuk semua request di luar instaloader.
+
+    Bagian async (httpx) dipakai handler untuk unduhan streaming; bagian sync
+    (requests.Session) dipakai kode yang berjalan di worker thread.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        config = config or {}
+        http_config = config.get("http", {})
+        self.timeout = config.get("request_timeout", 30)
+        self.pool_size = http_config.get("pool_size", 20)
+        self.keepalive = http_config.get("keepalive", 10)
+        self.chunk_size = http_config.get("chunk_size", 65536)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._async_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # Dibuat saat pertama dipakai agar terikat ke event loop yang sedang berjalan
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.keepalive
+                ),
+                follow_redirects=True
+            )
+            logger.info("HTTP pool ready: %s connections, timeout %ss", self.pool_size, self.timeout)
+        return self._async_client
+
+    async def fetch_bytes(self, url: str, headers: Optional[Dict[str, str]] = None,
+                          max_bytes: Optional[int] = None) -> bytes:
+        """Unduh isi URL; dengan max_bytes, batalkan begitu Content-Length atau jumlah byte melewati batas."""
+        async with self.async_client.stream("GET", url, headers=headers) as response:
+            response.raise_for_status()
+            if max_bytes is not None:
+                declared = response.headers.get("Content-Length")
+                if declared and declared.isdigit() and int(declared) > max_bytes:
+                    raise MediaTooLargeError(int(declared), max_bytes, "header")
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise MediaTooLargeError(size, max_bytes, "stream")
+                chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def get_conditional(self, url: str, headers: Optional[Dict[str, str]] = None,
+                              etag: Optional[str] = None, last_modified: Optional[str] = None) -> httpx.Response:
+        """GET dengan If-None-Match/If-Modified-Since; status 304 berarti salinan lokal masih berlaku."""
+        headers = dict(headers or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        response = await self.async_client.get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+        self.session.close()
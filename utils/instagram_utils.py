@@ -1,11 +1,17 @@
+import itertools
 import os
 import json
 import random
+import threading
 import time
-import requests
-from typing import Dict, List, Optional
-from instaloader import Instaloader, Profile, QueryReturnedBadRequestException, LoginRequiredException
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from instaloader import Instaloader, Profile, QueryReturnedBadRequestException, LoginRequiredException, RateController
+from instaloader.exceptions import QueryReturnedForbiddenException, TooManyRequestsException
 from dotenv import load_dotenv
+from utils.cache import TTLCache
+from utils.http_utils import HttpPool
+from utils.rate_limiter import RateGovernor
+from utils.metrics import timed, timer
 from utils.logging_utils import setup_logging
 
 load_dotenv()
@@ -13,28 +19,104 @@ logger = setup_logging()
 
 # Load User Agents
 def load_user_agents(file_path: str = "user-agents.json") -> List[str]:
-    logger.debug(f"Loading user agents from {file_path}")
+    logger.debug("Loading user agents from %s", file_path)
     try:
         with open(file_path, "r", encoding="utf-8") as f:
             agents = json.load(f)
             return [ua for ua in agents if isinstance(ua, str) and ua.strip()]
     except Exception as e:
-        logger.error(f"Error loading user agents: {str(e)}")
+        logger.error("Error loading user agents: %s", e)
         raise RuntimeError(f"Error loading user agents: {str(e)}")
 
 USER_AGENTS = load_user_agents()
 
+def is_auth_error(error: Exception) -> bool:
+    """Tebak apakah kegagalan disebabkan sesi login yang sudah tidak berlaku."""
+    if isinstance(error, (LoginRequiredException, QueryReturnedForbiddenException)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("login", "401 unauthorized", "checkpoint_required"))
+
+def is_throttle_error(error: Exception) -> bool:
+    """Tebak apakah Instagram sedang membatasi laju request kita."""
+    if isinstance(error, (TooManyRequestsException, QueryReturnedBadRequestException)):
+        return True
+    message = str(error).lower()
+    return "429" in message or "too many requests" in message or "please wait a few minutes" in message
+
+class GovernorRateController(RateController):
+    """RateController instaloader yang tunduk pada RateGovernor.
+
+    Jeda acak instaloader dimatikan (sleep=False); laju diatur governor. HTTP 429 tidak lagi
+    ditunggu dan diulang diam-diam di dalam get_json, tetapi dilempar ke call_with_session
+    agar governor melambat (on_throttle).
+    """
+
+    def __init__(self, context, governor: RateGovernor):
+        super().__init__(context)
+        self.governor = governor
+
+    def wait_before_query(self, query_type: str):
+        super().wait_before_query(query_type)  # Batas jendela geser instaloader tetap berlaku
+        remaining = self.governor.cooldown_remaining()
+        if remaining > 0:
+            logger.debug("Waiting %.1fs for throttle cooldown before %s query", remaining, query_type)
+            self.sleep(remaining)
+
+    def handle_429(self, query_type: str):
+        raise TooManyRequestsException(f"429 Too Many Requests ({query_type} query)")
+
+class SessionHealth:
+    """Catat kapan sesi terakhir terbukti valid, agar tidak divalidasi ulang di setiap panggilan."""
+
+    def __init__(self, trust_seconds: float = 900):
+        self.trust_seconds = trust_seconds
+        self.validated_at: Optional[float] = None
+        self.generation = 0  # Naik setiap login baru; dipakai relogin untuk mengenali sesi yang sudah diganti
+        self.relogins = 0
+
+    def mark_valid(self):
+        self.validated_at = time.monotonic()
+
+    def mark_renewed(self):
+        self.generation += 1
+        self.mark_valid()
+
+    def mark_invalid(self):
+        self.validated_at = None
+
+    def is_trusted(self) -> bool:
+        return (
+            self.validated_at is not None
+            and time.monotonic() - self.validated_at < self.trust_seconds
+        )
+
+class HighlightIndex:
+    """Daftar highlight satu profil beserta indeks O(1) berdasarkan unique_id."""
+
+    def __init__(self, highlights: List):
+        self.highlights = highlights
+        self.by_id = {highlight.unique_id: highlight for highlight in highlights}
+
+    def get(self, unique_id: int):
+        return self.by_id.get(unique_id)
+
 # Instagram Setup
 class InstagramClient:
-    def __init__(self, env_vars: Dict[str, str]):
+    def __init__(self, env_vars: Dict[str, str], config: Optional[dict] = None,
+                 loader: Optional[Instaloader] = None):
         self.env_vars = env_vars
+        self.config = config or {}
+        cache_config = self.config.get("cache", {})
         self.username = env_vars['INSTAGRAM_USERNAME']
         self.password = env_vars['INSTAGRAM_PASSWORD']
-        self.loader = Instaloader(
+        self.governor = RateGovernor.from_config(self.config)
+        self.loader = loader or Instaloader(
             user_agent=random.choice(USER_AGENTS),
-            sleep=True,
+            sleep=False,  # Jeda diatur governor, bukan do_sleep acak instaloader
+            rate_controller=lambda context: GovernorRateController(context, self.governor),
             quiet=True,
-            request_timeout=30,
+            request_timeout=self.config.get("request_timeout", 30),
             dirname_pattern="{target}",
             filename_pattern="{date_utc}_UTC_{profile}",
             download_pictures=True,
@@ -46,16 +128,64 @@ class InstagramClient:
             compress_json=False,
             download_comments=False
         )
-        self.login()
+        self.http = HttpPool(self.config)
+        rate_config = self.config.get("rate_limit", {})
+        self.jitter_seconds = rate_config.get("jitter_seconds", 1.0)
+        self.dummy_visit_chance = rate_config.get("dummy_visit_chance", 0.2)
         self.request_count = 0  # Untuk melacak jumlah permintaan
+        # True jika pemanggil (AsyncInstagramClient) sudah mengambil token governor sebelum masuk worker
+        self.paced_by_caller = False
+        self._request_lock = threading.Lock()  # Dipakai bersama oleh worker thread
+        self._login_lock = threading.Lock()
+        self.session_health = SessionHealth(self.config.get("session", {}).get("trust_seconds", 900))
+        self.profile_cache = TTLCache(
+            "profiles",
+            max_size=cache_config.get("profile_max_size", 256),
+            ttl=cache_config.get("profile_ttl", 600)
+        )
+        # Username jarang berganti pemilik, jadi indeks userid boleh hidup lebih lama
+        self.userid_index = TTLCache(
+            "userids",
+            max_size=cache_config.get("userid_index_size", 4096),
+            ttl=cache_config.get("userid_ttl", 86400)
+        )
+        self.highlight_cache = TTLCache(
+            "highlights",
+            max_size=cache_config.get("highlight_max_size", 128),
+            ttl=cache_config.get("highlight_ttl", 900)
+        )
+        # Stories cepat berganti; TTL pendek, disegarkan lebih awal oleh prefetch untuk profil populer
+        self.story_cache = TTLCache(
+            "stories",
+            max_size=cache_config.get("story_max_size", 512),
+            ttl=cache_config.get("story_ttl", 300)
+        )
+        self.session_file = f"session_{self.username}.dat"
+        if self.config.get("startup", {}).get("defer_login", False):
+            self.load_session()  # Validasi menyusul di latar lewat AsyncInstagramClient.start_background
+        else:
+            self.login()
+
+    def load_session(self) -> bool:
+        """Muat file sesi tanpa request ke Instagram; sesi belum dianggap valid sampai divalidasi."""
+        if not os.path.exists(self.session_file):
+            logger.info("No session file %s, login deferred", self.session_file)
+            return False
+        try:
+            self.loader.load_session_from_file(self.username, self.session_file)
+        except Exception as e:
+            logger.warning("Could not load session from %s: %s", self.session_file, e)
+            return False
+        logger.info("Session loaded from %s, validation deferred", self.session_file)
+        return True
 
-    def login(self):
+    def login(self, force: bool = False):
         """Login ke Instagram dan simpan sesi untuk penggunaan berikutnya (Saran 4)."""
-        logger.debug(f"Attempting to login as {self.username}")
-        session_file = f"session_{self.username}.dat"
+        logger.debug("Attempting to login as %s", self.username)
+        session_file = self.session_file
         try:
-            if os.path.exists(session_file):
-                logger.info(f"Loading existing session from {session_file}")
+            if os.path.exists(session_file) and not force:
+                logger.info("Loading existing session from %s", session_file)
                 self.loader.load_session_from_file(self.username, session_file)
                 if self.validate_session():
                     logger.info("Session loaded and validated successfully")
@@ -63,31 +193,88 @@ class InstagramClient:
                     logger.warning("Loaded session invalid, performing new login")
                     self.loader.login(self.username, self.password)
                     self.loader.save_session_to_file(session_file)
-                    logger.info(f"New session saved to {session_file}")
+                    self.session_health.mark_renewed()
+                    logger.info("New session saved to %s", session_file)
             else:
                 self.loader.login(self.username, self.password)
                 self.loader.save_session_to_file(session_file)
-                logger.info(f"Session saved to {session_file}")
+                self.session_health.mark_renewed()
+                logger.info("Session saved to %s", session_file)
         except Exception as e:
-            logger.error(f"Login failed: {str(e)}")
+            logger.error("Login failed: %s", e)
             raise RuntimeError(f"Failed to login: {str(e)}")
 
+    def load_profile(self, username: str) -> Profile:
+        """Satu request profil ke Instagram, tanpa cache maupun pengaturan laju."""
+        return Profile.from_username(self.loader.context, username)
+
     def validate_session(self) -> bool:
-        """Validasi sesi dengan mencoba mengambil profil pengguna sendiri."""
-        logger.debug(f"Validating session for {self.username}")
+        """Validasi sesi dengan mencoba mengambil profil pengguna sendiri.
+
+        Profil publik tetap bisa diambil tanpa login, jadi sesi hanya dianggap valid jika loader
+        memang sedang login (mis. load_session gagal atau belum pernah login).
+        """
+        logger.debug("Validating session for %s", self.username)
+        if not self.loader.context.is_logged_in:
+            self.session_health.mark_invalid()
+            logger.info("No logged-in Instagram session for %s", self.username)
+            return False
         try:
-            Profile.from_username(self.loader.context, self.username)
+            self.load_profile(self.username)
+            self.session_health.mark_valid()
             logger.info("Session validated successfully")
             return True
         except (LoginRequiredException, Exception) as e:
-            logger.error(f"Session validation failed: {str(e)}")
+            self.session_health.mark_invalid()
+            logger.error("Session validation failed: %s", e)
             return False
 
     def ensure_valid_session(self):
-        """Pastikan sesi valid, login ulang jika perlu (Saran 4)."""
-        if not self.validate_session():
-            logger.warning("Invalid session detected, attempting to re-login")
-            self.login()
+        """Pastikan sesi valid, login ulang jika perlu (Saran 4); sesi yang baru tervalidasi dipercaya."""
+        if self.session_health.is_trusted():
+            return
+        with self._login_lock:
+            if self.session_health.is_trusted():
+                return
+            if not self.validate_session():
+                # Juga jalur login pertama saat startup jika load_session tidak menemukan sesi
+                logger.warning("Invalid session detected, attempting to re-login")
+                self.login(force=True)
+
+    def relogin(self, generation: int):
+        """Login ulang setelah kegagalan otentikasi, sekali saja walau dipanggil banyak thread.
+
+        generation adalah session_health.generation saat operasi yang gagal dimulai; jika sudah
+        berubah, worker lain telah login ulang dan sesi barunya langsung dipakai.
+        """
+        with self._login_lock:
+            if self.session_health.generation != generation:
+                logger.debug("Session already refreshed by another worker")
+                return
+            self.session_health.mark_invalid()
+            self.session_health.relogins += 1
+            logger.warning("Re-logging in after authentication failure")
+            self.login(force=True)
+
+    def call_with_session(self, operation: Callable):
+        """Jalankan operasi Instagram; jika gagal karena sesi, login ulang lalu coba sekali lagi."""
+        self.ensure_valid_session()
+        self.simulate_human_behavior()
+        generation = self.session_health.generation
+        try:
+            result = operation()
+        except Exception as e:
+            if is_throttle_error(e):
+                self.governor.on_throttle()
+                raise
+            if not is_auth_error(e):
+                raise
+            logger.warning("Authentication failure detected: %s", e)
+            self.relogin(generation)
+            result = operation()
+        self.session_health.mark_valid()
+        self.governor.on_success()
+        return result
 
     def get_random_headers(self) -> Dict[str, str]:
         """Buat header dinamis untuk meniru browser manusia (Saran 3)."""
@@ -98,80 +285,190 @@ class InstagramClient:
             "Connection": "keep-alive",
             "Referer": "https://www.instagram.com/"
         }
-        logger.debug(f"Generated random headers")
+        logger.debug("Generated random headers")
         return headers
 
     def simulate_human_behavior(self):
-        """Simulasikan perilaku manusia dengan delay acak dan kunjungan dummy (Saran 1 & 5)."""
-        self.request_count += 1
-        logger.debug(f"Request count: {self.request_count}")
+        """Atur jarak antar request lewat rate governor, dengan jitter kecil dan kunjungan dummy (Saran 1 & 5)."""
+        with self._request_lock:
+            self.request_count += 1
+            request_count = self.request_count
+        logger.debug("Request count: %s", request_count)
+        if self.paced_by_caller:
+            return  # Jeda sudah dijalani di event loop; worker hanya melakukan I/O
 
-        # Delay variabel acak (Saran 1)
-        delay = random.uniform(2, 5)
-        logger.debug(f"Applying human-like delay of {delay:.2f} seconds")
-        time.sleep(delay)
-
-        # Jeda panjang acak setelah beberapa permintaan (Saran 1)
-        if self.request_count % random.randint(5, 10) == 0:
-            long_delay = random.uniform(30, 60)
-            logger.info(f"Simulating long pause of {long_delay:.2f} seconds")
-            time.sleep(long_delay)
+        with timer("instbot_pacing_seconds"):
+            self.governor.acquire()
+            # Jitter kecil agar pola request tidak terlalu teratur (Saran 1)
+            if self.jitter_seconds > 0:
+                self.governor.sleep(random.uniform(0, self.jitter_seconds))
 
         # Simulasi kunjungan dummy ke halaman lain (Saran 5)
-        if random.random() < 0.2:  # 20% kemungkinan
+        if random.random() < self.dummy_visit_chance:
             logger.debug("Simulating dummy visit to Instagram homepage")
-            requests.get("https://www.instagram.com/", headers=self.get_random_headers())
-            time.sleep(random.uniform(1, 3))
+            self.governor.acquire()
+            self.http.session.get("https://www.instagram.com/", headers=self.get_random_headers(), timeout=self.http.timeout)
+
+    def rate_stats(self) -> Dict[str, float]:
+        return self.governor.snapshot()
 
     def get_profile(self, username: str) -> Profile:
-        """Ambil profil dengan simulasi perilaku manusia (Saran 1, 5)."""
-        logger.debug(f"Fetching profile for username: {username}")
-        self.ensure_valid_session()
-        self.simulate_human_behavior()
+        """Ambil profil dengan simulasi perilaku manusia (Saran 1, 5), memakai cache jika ada."""
+        profile = self.profile_cache.get(username.lower())
+        if profile is not None:
+            logger.debug("Profile cache hit for %s", username)
+            return profile
+        return self.fetch_profile(username)
+
+    @timed("instbot_instagram_seconds")
+    def fetch_profile(self, username: str) -> Profile:
+        """Ambil profil dari Instagram tanpa melihat cache, lalu simpan ke cache."""
+        key = username.lower()
+        logger.debug("Fetching profile for username: %s", username)
         try:
-            profile = Profile.from_username(self.loader.context, username)
-            logger.info(f"Profile fetched successfully for {username}")
+            profile = self.call_with_session(lambda: self.load_profile(username))
+            self.profile_cache.set(key, profile)
+            self.userid_index.set(key, profile.userid)
+            logger.info("Profile fetched successfully for %s", username)
             return profile
         except Exception as e:
-            logger.error(f"Failed to fetch profile for {username}: {str(e)}")
+            logger.error("Failed to fetch profile for %s: %s", username, e)
             raise
 
-    def get_stories(self, user_ids: List[int]) -> List:
-        """Ambil stories dengan simulasi perilaku (Saran 1, 5)."""
-        logger.debug(f"Fetching stories for user IDs: {user_ids}")
-        self.ensure_valid_session()
-        self.simulate_human_behavior()
-        try:
-            stories = []
+    def cache_stats(self) -> Dict[str, Dict]:
+        """Statistik hit/miss cache untuk tuning ukuran."""
+        return {
+            "profiles": self.profile_cache.stats(),
+            "userids": self.userid_index.stats(),
+            "highlights": self.highlight_cache.stats(),
+            "stories": self.story_cache.stats()
+        }
+
+    def get_stories_by_user(self, user_ids: List[int], refresh: bool = False) -> Dict[int, List]:
+        """Ambil stories banyak user sekaligus (satu query reel) dan pisahkan per user ID."""
+        cached = {} if refresh else {userid: self.story_cache.get(userid) for userid in user_ids}
+        missing = [userid for userid in user_ids if cached.get(userid) is None]
+        if missing:
+            cached.update(self.fetch_stories_by_user(missing))
+        else:
+            logger.debug("Story cache hit for user IDs: %s", user_ids)
+        return {userid: cached.get(userid) or [] for userid in user_ids}
+
+    @timed("instbot_instagram_seconds")
+    def fetch_stories_by_user(self, user_ids: List[int]) -> Dict[int, List]:
+        """Satu query reel untuk user ID ini tanpa melihat cache; hasil per user disimpan ke cache."""
+        logger.debug("Fetching stories for user IDs: %s", user_ids)
+
+        def fetch_stories() -> Dict[int, List]:
+            by_owner = {userid: [] for userid in user_ids}
             for story in self.loader.get_stories(user_ids):
-                stories.extend(story.get_items())
-            logger.info(f"Fetched {len(stories)} stories")
-            return stories
+                by_owner.setdefault(story.owner_id, []).extend(story.get_items())
+            return by_owner
+
+        try:
+            fetched = self.call_with_session(fetch_stories)
         except Exception as e:
-            logger.error(f"Failed to fetch stories: {str(e)}")
+            logger.error("Failed to fetch stories: %s", e)
+            raise
+        for userid, items in fetched.items():
+            self.story_cache.set(userid, items)
+        logger.info("Fetched %s stories for %s users", sum(len(items) for items in fetched.values()), len(user_ids))
+        return fetched
+
+    def get_stories(self, user_ids: List[int], refresh: bool = False) -> List:
+        """Ambil stories dengan simulasi perilaku (Saran 1, 5); hanya user ID tanpa cache yang diminta."""
+        by_user = self.get_stories_by_user(user_ids, refresh)
+        return [item for userid in user_ids for item in by_user[userid]]
+
+    def get_highlight_index(self, profile: Profile) -> HighlightIndex:
+        """Ambil highlights dengan simulasi perilaku (Saran 1, 5), di-cache per profil."""
+        index = self.highlight_cache.get(profile.userid)
+        if index is not None:
+            logger.debug("Highlight cache hit for profile: %s", profile.username)
+            return index
+        return self.fetch_highlight_index(profile)
+
+    @timed("instbot_instagram_seconds")
+    def fetch_highlight_index(self, profile: Profile) -> HighlightIndex:
+        """Ambil daftar highlight dari Instagram tanpa melihat cache, lalu simpan ke cache."""
+        logger.debug("Fetching highlights for profile: %s", profile.username)
+        try:
+            index = self.call_with_session(lambda: HighlightIndex(list(self.loader.get_highlights(user=profile))))
+            self.highlight_cache.set(profile.userid, index)
+            logger.info("Fetched %s highlights", len(index.highlights))
+            return index
+        except Exception as e:
+            logger.error("Failed to fetch highlights: %s", e)
             raise
 
     def get_highlights(self, profile: Profile) -> List:
-        """Ambil highlights dengan simulasi perilaku (Saran 1, 5)."""
-        logger.debug(f"Fetching highlights for profile: {profile.username}")
-        self.ensure_valid_session()
-        self.simulate_human_behavior()
+        return self.get_highlight_index(profile).highlights
+
+    def get_highlight(self, profile: Profile, unique_id: int):
+        """Cari satu highlight berdasarkan unique_id tanpa pencarian linear."""
+        return self.get_highlight_index(profile).get(unique_id)
+
+    @timed("instbot_instagram_seconds")
+    def open_highlight_items(self, highlight, count: int) -> Tuple[Iterator, List, int]:
+        """Mulai iterasi item highlight dan ambil `count` item pertama; sisanya diambil bertahap.
+
+        Juga mengembalikan jumlah item: itemcount instaloader memicu request yang sama dengan
+        get_items, jadi dibaca di sini (di worker) dan bukan di event loop.
+        """
+        logger.debug("Opening item stream for highlight %s", highlight.unique_id)
+
+        def start():
+            iterator = iter(highlight.get_items())
+            return iterator, list(itertools.islice(iterator, count)), highlight.itemcount
+
         try:
-            highlights = list(self.loader.get_highlights(user=profile))
-            logger.info(f"Fetched {len(highlights)} highlights")
-            return highlights
+            return self.call_with_session(start)
         except Exception as e:
-            logger.error(f"Failed to fetch highlights: {str(e)}")
+            logger.error("Failed to open highlight items: %s", e)
             raise
 
+    @timed("instbot_instagram_seconds")
+    def next_items(self, iterator: Iterator, count: int) -> List:
+        """Ambil hingga `count` item berikutnya; list kosong berarti iterator sudah habis."""
+        return list(itertools.islice(iterator, count))
+
+    @timed("instbot_instagram_seconds")
+    def get_profile_pic_url(self, profile: Profile) -> str:
+        """URL foto profil; saat login instaloader mengambilnya lewat API iPhone (satu request)."""
+        try:
+            return self.call_with_session(lambda: profile.profile_pic_url)
+        except Exception as e:
+            logger.error("Failed to fetch profile picture URL for %s: %s", profile.username, e)
+            raise
+
+    @timed("instbot_instagram_seconds")
     def download_storyitem(self, item, target: str):
         """Unduh story item dengan simulasi (Saran 1, 5)."""
-        logger.debug(f"Downloading story item {item.mediaid} to {target}")
-        self.ensure_valid_session()
-        self.simulate_human_behavior()
+        logger.debug("Downloading story item %s to %s", item.mediaid, target)
         try:
-            self.loader.download_storyitem(item, target)
-            logger.info(f"Story item {item.mediaid} downloaded successfully")
+            self.call_with_session(lambda: self.loader.download_storyitem(item, target))
+            logger.info("Story item %s downloaded successfully", item.mediaid)
         except Exception as e:
-            logger.error(f"Failed to download story item {item.mediaid}: {str(e)}")
+            logger.error("Failed to download story item %s: %s", item.mediaid, e)
             raise
+
+    @timed("instbot_instagram_seconds")
+    def resolve_media_urls(self, item) -> List[str]:
+        """URL CDN kandidat untuk item, dari varian video terbesar ke terkecil; gambar jika bukan video."""
+        if item.is_video:
+            # video_resources sudah ada di node GraphQL; item.video_url justru melakukan HEAD ke setiap varian
+            resources = getattr(item, "_node", {}).get("video_resources") or []
+            resources = sorted(
+                resources, key=lambda resource: resource.get("config_width", 0) * resource.get("config_height", 0),
+                reverse=True
+            )
+            urls = list(dict.fromkeys(resource["src"] for resource in resources if resource.get("src")))
+            if not urls and item.video_url:
+                urls = [item.video_url]
+            if urls:
+                return urls
+        return [item.url]
+
+    def resolve_media_url(self, item) -> str:
+        """URL CDN terbaik untuk item (varian video terbesar, selain itu gambar)."""
+        return self.resolve_media_urls(item)[0]
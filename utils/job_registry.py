@@ -0,0 +1,41 @@
+import asyncio
+from typing import Awaitable, Dict, Hashable, Optional
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class DeliveryJob:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.stopped = False  # True jika dibatalkan lewat tombol Stop, bukan karena shutdown
+
+class JobRegistry:
+    """Job pengiriman yang sedang berjalan per kunci, agar bisa dihentikan dari update lain."""
+
+    def __init__(self):
+        self._jobs: Dict[Hashable, DeliveryJob] = {}
+
+    def start(self, key: Hashable, coro: Awaitable) -> Optional[DeliveryJob]:
+        """Jalankan coro sebagai job baru; None jika job dengan kunci yang sama masih berjalan."""
+        existing = self._jobs.get(key)
+        if existing is not None and not existing.task.done():
+            coro.close()
+            return None
+        job = self._jobs[key] = DeliveryJob(asyncio.ensure_future(coro))
+        job.task.add_done_callback(lambda _: self._finish(key, job))
+        return job
+
+    def _finish(self, key: Hashable, job: DeliveryJob):
+        if self._jobs.get(key) is job:
+            del self._jobs[key]
+
+    def stop(self, key: Hashable) -> bool:
+        job = self._jobs.get(key)
+        if job is None or job.task.done():
+            return False
+        logger.info("Stopping delivery job %s", key)
+        job.stopped = True
+        job.task.cancel()
+        return True
+
+delivery_jobs = JobRegistry()
@@ -1,35 +1,146 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import re
+import time
 from functools import wraps
-import traceback
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+SENSITIVE_PATTERN = re.compile(r'(sessionid|csrftoken)=[^;\s"\']+')
+SENSITIVE_MARKERS = ("sessionid", "csrftoken")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_listener_pid: Optional[int] = None
 
 class SensitiveDataFilter(logging.Filter):
+    """Sensor cookie sesi; regex hanya dijalankan jika pesan memang memuat nama cookie."""
+
     def filter(self, record):
-        record.msg = re.sub(r'sessionid=[^;]+', 'sessionid=****', str(record.msg))
-        record.msg = re.sub(r'csrftoken=[^;]+', 'csrftoken=****', str(record.msg))
+        message = record.getMessage()
+        if any(marker in message for marker in SENSITIVE_MARKERS):
+            record.msg = SENSITIVE_PATTERN.sub(r'\1=****', message)
+            record.args = None
         return True
 
-def setup_logging(level=logging.INFO):
-    logging.basicConfig(
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        level=level
-    )
+class JsonFormatter(logging.Formatter):
+    """Satu objek JSON per baris agar log mudah diolah."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+PLAIN_TYPES = (str, int, float, bool, type(None))
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler yang sebisa mungkin tidak memformat pesan di thread pemanggil.
+
+    Record dengan argumen bertipe sederhana dikirim apa adanya; interpolasi, sensor dan JSON
+    terjadi di thread listener. Objek lain (profil, exception, dict) bisa berubah atau tidak
+    aman dibaca dari thread lain sebelum listener sempat memformatnya, jadi record seperti itu
+    dan record dengan exc_info diformat langsung lewat prepare() bawaan.
+    """
+
+    def prepare(self, record):
+        if record.exc_info or not self._plain_args(record.args):
+            return super().prepare(record)
+        return record
+
+    @staticmethod
+    def _plain_args(args) -> bool:
+        if not args:
+            return True
+        values = args.values() if isinstance(args, dict) else args
+        return all(isinstance(value, PLAIN_TYPES) for value in values)
+
+def setup_logging(level=None):
+    logging.basicConfig(format=TEXT_FORMAT, level=level or logging.INFO)
     logger = logging.getLogger(__name__)
-    logger.addFilter(SensitiveDataFilter())
+    if level is not None:
+        logger.setLevel(level)
+    for handler in logging.getLogger().handlers:
+        # Handler antrean tidak disensor; sensor berjalan di handler keluaran milik listener
+        if isinstance(handler, DeferredQueueHandler):
+            continue
+        if not any(isinstance(f, SensitiveDataFilter) for f in handler.filters):
+            handler.addFilter(SensitiveDataFilter())
     return logger
 
+def configure_logging(config: dict):
+    """Atur level, format (text/json) dan antrean log dari config["logging"]; LOG_LEVEL di env menimpa level."""
+    global _listener, _listener_pid
+    log_config = config.get("logging", {})
+    level_name = os.getenv("LOG_LEVEL", log_config.get("level", "INFO")).upper()
+    level = getattr(logging, level_name, logging.INFO)
+
+    output = logging.StreamHandler()
+    if log_config.get("format", "text") == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    # Sensor di handler keluaran agar log dari library lain juga ikut disensor
+    output.addFilter(SensitiveDataFilter())
+
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None  # Listener milik proses induk tidak ikut hidup setelah fork
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if log_config.get("async", True):
+        log_queue = queue.SimpleQueue()
+        root.addHandler(DeferredQueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+    else:
+        root.addHandler(output)
+    root.setLevel(level)
+
+    if level > logging.DEBUG:
+        # Library HTTP mencatat setiap request di level INFO
+        for noisy in log_config.get("quiet_loggers", ["httpx", "httpcore", "urllib3"]):
+            logging.getLogger(noisy).setLevel(logging.WARNING)
+    return logging.getLogger(__name__)
+
+def stop_logging():
+    """Kuras antrean log sebelum proses berhenti."""
+    global _listener
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+atexit.register(stop_logging)
+
 def log_errors(logger):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
+            # repr argumen (objek Telegram) mahal; hanya dibuat jika DEBUG aktif
+            debug = logger.isEnabledFor(logging.DEBUG)
             try:
-                logger.debug(f"Starting {func.__name__} with args: {args}, kwargs: {kwargs}")
+                if debug:
+                    logger.debug("Starting %s with args: %r, kwargs: %r", func.__name__, args, kwargs)
                 result = await func(*args, **kwargs)
-                logger.debug(f"Completed {func.__name__} successfully")
+                if debug:
+                    logger.debug("Completed %s successfully", func.__name__)
                 return result
             except Exception as e:
-                logger.error(f"Error in {func.__name__}: {str(e)}")
-                logger.debug(f"Traceback: {traceback.format_exc()}")
+                logger.error("Error in %s: %s", func.__name__, e)
+                logger.debug("Traceback for %s", func.__name__, exc_info=True)
                 raise
         return wrapper
     return decorator
@@ -0,0 +1,263 @@
+import asyncio
+import bisect
+import concurrent.futures
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COLLECT_TIMEOUT = 2.0  # Batas tunggu snapshot dari event loop yang sedang sibuk
+LabelKey = Tuple[Tuple[str, str], ...]
+Collector = Callable[[], Iterable[Tuple[str, Dict[str, str], float]]]
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Slot terakhir untuk +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> float:
+        """Perkiraan kuantil dari batas bucket (cukup untuk /stats)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+class MetricsRegistry:
+    """Kumpulan counter, gauge dan histogram sederhana dengan format teks Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.help: Dict[str, str] = {}
+        self.collectors: List[Tuple[Collector, bool]] = []
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # Pemilik state collector loop_owned
+
+    def describe(self, name: str, text: str):
+        self.help[name] = text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def adjust_gauge(self, name: str, delta: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + delta
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def register_collector(self, collector: Collector, loop_owned: bool = False):
+        """Collector dipanggil saat scrape dan mengembalikan (nama, label, nilai) sebagai gauge.
+
+        loop_owned=True untuk collector yang membaca state milik event loop (dict, antrean, task):
+        collector itu dijalankan di loop yang diikat lewat bind_loop, bukan di thread server metrik.
+        """
+        self.collectors.append((collector, loop_owned))
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def _snapshot(self, collector: Collector, loop_owned: bool) -> List[Tuple[str, Dict[str, str], float]]:
+        loop = self.loop
+        if not loop_owned or loop is None or not loop.is_running():
+            return list(collector())  # Tanpa loop yang berjalan tidak ada yang mengubah state bersamaan
+        try:
+            if asyncio.get_running_loop() is loop:
+                return list(collector())  # Mis. /stats, sudah berada di loop pemilik
+        except RuntimeError:
+            pass
+        future: concurrent.futures.Future = concurrent.futures.Future()
+
+        def snapshot():
+            try:
+                future.set_result(list(collector()))
+            except Exception as e:
+                future.set_exception(e)
+
+        loop.call_soon_threadsafe(snapshot)
+        return future.result(timeout=COLLECT_TIMEOUT)
+
+    def _collect_gauges(self) -> Dict[str, Dict[LabelKey, float]]:
+        with self._lock:
+            gauges = {name: dict(series) for name, series in self.gauges.items()}
+        for collector, loop_owned in list(self.collectors):
+            try:
+                samples = self._snapshot(collector, loop_owned)
+            except concurrent.futures.TimeoutError:
+                logger.warning("Metrics collector %s timed out waiting for the event loop",
+                               getattr(collector, "__qualname__", collector))
+                continue
+            except Exception:
+                logger.exception("Metrics collector %s failed", getattr(collector, "__qualname__", collector))
+                continue
+            for name, labels, value in samples:
+                gauges.setdefault(name, {})[_label_key(labels)] = value
+        return gauges
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def header(name: str, kind: str):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+        for name, series in sorted(counters.items()):
+            header(name, "counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in sorted(self._collect_gauges().items()):
+            header(name, "gauge")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in sorted(histograms.items()):
+            header(name, "histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.total}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def render_summary(self) -> str:
+        """Ringkasan pendek untuk perintah /stats admin."""
+        lines = ["📈 Latency (count, avg, p50, p95):"]
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        for name, series in sorted(histograms.items()):
+            for key, histogram in sorted(series.items()):
+                if not histogram.count:
+                    continue
+                label = ",".join(value for _, value in key) or "-"
+                lines.append(
+                    f"• {name.replace('instbot_', '')}[{label}]: {histogram.count}, "
+                    f"{histogram.total / histogram.count:.2f}s, {histogram.quantile(0.5)}s, {histogram.quantile(0.95)}s"
+                )
+        lines.append("📦 Counters:")
+        for name, series in sorted(counters.items()):
+            for key, value in sorted(series.items()):
+                label = ",".join(value for _, value in key)
+                lines.append(f"• {name.replace('instbot_', '')}{f'[{label}]' if label else ''}: {value:,.0f}")
+        lines.append("📊 Gauges:")
+        for name, series in sorted(self._collect_gauges().items()):
+            for key, value in sorted(series.items()):
+                label = ",".join(value for _, value in key)
+                lines.append(f"• {name.replace('instbot_', '')}{f'[{label}]' if label else ''}: {value:g}")
+        return "\n".join(lines)
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("instbot_handler_seconds", "Latency of Telegram handlers")
+REGISTRY.describe("instbot_instagram_seconds", "Latency of InstagramClient methods")
+REGISTRY.describe("instbot_pacing_seconds", "Time spent waiting on the rate governor and jitter")
+REGISTRY.describe("instbot_telegram_upload_seconds", "Latency of Telegram media sends")
+REGISTRY.describe("instbot_in_flight", "Async jobs currently running, per function")
+REGISTRY.describe("instbot_downloaded_bytes_total", "Media bytes downloaded from Instagram")
+REGISTRY.describe("instbot_uploaded_bytes_total", "Media bytes uploaded to Telegram")
+
+@contextmanager
+def timer(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(name, time.perf_counter() - start, **labels)
+
+def timed(name: str, label: str = "method"):
+    """Decorator pencatat durasi (dan job yang sedang berjalan) untuk fungsi sync maupun async."""
+    def decorator(func):
+        labels = {label: func.__name__}
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                REGISTRY.adjust_gauge("instbot_in_flight", 1, **labels)
+                try:
+                    with timer(name, **labels):
+                        return await func(*args, **kwargs)
+                finally:
+                    REGISTRY.adjust_gauge("instbot_in_flight", -1, **labels)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_metrics_server(config: dict, port_offset: int = 0) -> Optional[ThreadingHTTPServer]:
+    """Jalankan endpoint /metrics (format teks Prometheus) di thread latar belakang."""
+    metrics_config = config.get("metrics", {})
+    if not metrics_config.get("enabled", False):
+        return None
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    host = metrics_config.get("host", "127.0.0.1")
+    port = metrics_config.get("port", 9108) + port_offset
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Metrics endpoint listening on http://%s:%s/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,184 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from instaloader import ProfileNotExistsException
+from utils.file_id_cache import get_file_id_cache
+from utils.metrics import REGISTRY
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class DecayingCounter:
+    """Frekuensi permintaan per kunci yang meluruh eksponensial (LFU dengan half-life)."""
+
+    def __init__(self, half_life: float = 3600, max_keys: int = 10000):
+        self.decay = math.log(2) / half_life
+        self.max_keys = max_keys
+        self._scores: Dict[str, Tuple[float, float]] = {}  # kunci -> (skor, waktu pembaruan)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score: float, updated: float, now: float) -> float:
+        return score * math.exp(-self.decay * (now - updated))
+
+    def hit(self, key: str, weight: float = 1.0):
+        now = time.monotonic()
+        with self._lock:
+            score, updated = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, updated, now) + weight, now)
+            if len(self._scores) > self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        # Buang 10% kunci dengan skor terendah
+        ranked = sorted(self._scores.items(), key=lambda entry: self._decayed(*entry[1], now))
+        for key, _ in ranked[:max(1, len(ranked) // 10)]:
+            del self._scores[key]
+
+    def top(self, k: int, min_score: float = 0.0) -> List[Tuple[str, float]]:
+        now = time.monotonic()
+        with self._lock:
+            scored = [(key, self._decayed(score, updated, now)) for key, (score, updated) in self._scores.items()]
+        scored = [entry for entry in scored if entry[1] >= min_score]
+        scored.sort(key=lambda entry: entry[1], reverse=True)
+        return scored[:k]
+
+    def discard(self, key: str):
+        with self._lock:
+            self._scores.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+class StoryPrefetcher:
+    """Segarkan stories dan media profil terpopuler secara berkala, dalam batas request per siklus."""
+
+    def __init__(self, client, config: dict):
+        prefetch_config = config.get("prefetch", {})
+        self.client = client
+        self.config = config
+        self.enabled = prefetch_config.get("enabled", False)
+        self.top_k = prefetch_config.get("top_k", 20)
+        self.interval = prefetch_config.get("interval_seconds", 240)
+        self.request_budget = prefetch_config.get("request_budget", 40)
+        self.min_score = prefetch_config.get("min_score", 2)
+        self.counter = DecayingCounter(
+            half_life=prefetch_config.get("half_life_seconds", 3600),
+            max_keys=prefetch_config.get("max_tracked", 10000)
+        )
+        self.cycles = 0
+        self.last_requests = 0
+        self.warmed_items = 0
+        self._task: Optional[asyncio.Task] = None
+        REGISTRY.register_collector(self.collect_metrics, loop_owned=True)
+
+    def record(self, username: str):
+        """Catat satu permintaan story untuk username ini (hanya profil yang sudah berhasil dimuat)."""
+        self.counter.hit(username.lower())
+
+    def forget(self, username: str):
+        """Hapus username yang tidak bisa lagi di-resolve (dihapus atau berganti nama)."""
+        self.counter.discard(username.lower())
+
+    def collect_metrics(self):
+        yield "instbot_prefetch_tracked_profiles", {}, len(self.counter)
+        yield "instbot_prefetch_cycles", {}, self.cycles
+        yield "instbot_prefetch_last_cycle_requests", {}, self.last_requests
+        yield "instbot_prefetch_warmed_items", {}, self.warmed_items
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        logger.info(
+            "Story prefetch enabled: top %s profiles every %ss, %s requests per cycle",
+            self.top_k, self.interval, self.request_budget
+        )
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_cycle()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Story prefetch cycle failed: %s", e)
+
+    def _should_yield(self) -> bool:
+        """Jangan bersaing dengan pengguna saat worker sibuk atau Instagram sedang membatasi."""
+        if self.client.pending > self.client.max_workers // 2:
+            return True
+        return self.client.rate_stats()["blocked_for_seconds"] > 0
+
+    async def run_cycle(self) -> int:
+        """Satu putaran prefetch; kembalikan jumlah request yang dipakai."""
+        self.cycles += 1
+        hot = self.counter.top(self.top_k, self.min_score)
+        budget = self.request_budget
+        if not hot or self._should_yield():
+            self.last_requests = 0
+            return 0
+
+        user_ids = []
+        for username, _ in hot:
+            userid = self.client.client.userid_index.get(username)
+            if userid is None:
+                if budget <= 1:
+                    continue  # Sisakan satu request untuk daftar stories
+                budget -= 1
+                try:
+                    profile = await self.client.get_profile(username)
+                except asyncio.CancelledError:
+                    raise
+                except ProfileNotExistsException:
+                    logger.info("Prefetch dropping %s: profile no longer exists", username)
+                    self.forget(username)
+                    continue
+                except Exception as e:
+                    # Satu username yang gagal tidak boleh menggagalkan seluruh siklus
+                    logger.warning("Prefetch could not resolve %s: %s", username, e)
+                    continue
+                if profile.is_private and not profile.followed_by_viewer:
+                    self.forget(username)
+                    continue
+                userid = profile.userid
+            user_ids.append(userid)
+
+        if not user_ids or budget <= 0:
+            self.last_requests = self.request_budget - budget
+            return self.last_requests
+        # Satu panggilan untuk semua profil panas; instaloader menggabungkannya per batch
+        stories = await self.client.get_stories(user_ids, refresh=True)
+        budget -= 1
+
+        file_ids = get_file_id_cache(self.config)
+        warmed = 0
+        for item in sorted(stories, key=lambda story_item: story_item.date_utc, reverse=True):
+            if budget <= 0 or self._should_yield():
+                break
+            if (self.client.media_cache.get(item.mediaid) is not None
+                    or await asyncio.to_thread(file_ids.contains, item.mediaid)):
+                continue  # Sudah bisa dilayani tanpa mengunduh
+            try:
+                await self.client.fetch_media(item, keep=True)
+                warmed += 1
+            except Exception as e:
+                logger.debug("Prefetch of item %s failed: %s", item.mediaid, e)
+            budget -= 1
+
+        self.warmed_items += warmed
+        self.last_requests = self.request_budget - budget
+        logger.info(
+            "Prefetched stories for %s profiles, warmed %s items using %s requests",
+            len(user_ids), warmed, self.last_requests
+        )
+        return self.last_requests
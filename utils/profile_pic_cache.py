@@ -0,0 +1,143 @@
+import os
+import posixpath
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+from utils.logging_utils import setup_logging
+from utils.metrics import REGISTRY
+
+logger = setup_logging()
+
+class ProfilePicEntry(NamedTuple):
+    data: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+def profile_pic_key(username: str, url: str) -> str:
+    """Kunci cache: username + ID aset (nama file di path CDN); query string bertanda tangan diabaikan."""
+    asset_id = posixpath.basename(urlsplit(url).path) or url.split("?", 1)[0]
+    return f"profile_pic:{username.lower()}:{asset_id}"
+
+class ProfilePicCache:
+    """Isi foto profil HD beserta validator HTTP (ETag/Last-Modified), dibatasi total byte (SQLite, LRU)."""
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, revalidate_after: float = 86400,
+                 touch_batch: int = 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}  # Waktu pakai yang belum ditulis ke SQLite
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS profile_pics ("
+            "cache_key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, etag TEXT, "
+            "last_modified TEXT, validated_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_profile_pics_last_used ON profile_pics (last_used)")
+        self._conn.commit()
+        logger.info("Profile picture cache opened at %s", path)
+
+    def get(self, cache_key: str) -> Optional[ProfilePicEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, etag, last_modified, validated_at FROM profile_pics WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._touched[cache_key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touches()
+            self.hits += 1
+        return ProfilePicEntry(bytes(row[0]), row[1], row[2], row[3])
+
+    def is_fresh(self, entry: ProfilePicEntry) -> bool:
+        """Entri yang baru divalidasi dipakai langsung tanpa request ke CDN."""
+        return time.time() - entry.validated_at < self.revalidate_after
+
+    def set(self, cache_key: str, data: bytes, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO profile_pics "
+                "(cache_key, data, size, etag, last_modified, validated_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, sqlite3.Binary(data), len(data), etag, last_modified, now, now)
+            )
+            self._flush_touches()
+            self._evict()
+            self._conn.commit()
+
+    def mark_validated(self, cache_key: str):
+        """Catat bahwa CDN menjawab 304 untuk entri ini."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE profile_pics SET validated_at = ? WHERE cache_key = ?", (time.time(), cache_key)
+            )
+            self._conn.commit()
+
+    def _flush_touches(self):
+        # Dipanggil dengan _lock dipegang; waktu pakai ditulis bertahap, bukan per lookup
+        if not self._touched:
+            return
+        self._conn.executemany(
+            "UPDATE profile_pics SET last_used = ? WHERE cache_key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()]
+        )
+        self._touched.clear()
+        self._conn.commit()
+
+    def _evict(self):
+        # Buang entri yang paling lama tidak dipakai sampai total ukuran di bawah batas
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM profile_pics").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for cache_key, size in self._conn.execute(
+            "SELECT cache_key, size FROM profile_pics ORDER BY last_used ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM profile_pics WHERE cache_key = ?", (cache_key,))
+            total -= size
+            evicted += 1
+        logger.debug("Evicted %s entries from profile picture cache", evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            size, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM profile_pics"
+            ).fetchone()
+        return {"size": size, "bytes": total, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+    def collect_metrics(self):
+        lookups = self.hits + self.misses
+        yield "instbot_cache_hit_rate", {"cache": "profile_pics"}, round(self.hits / lookups, 3) if lookups else 0.0
+
+_profile_pic_cache: Optional[ProfilePicCache] = None
+
+def get_profile_pic_cache(config: dict) -> ProfilePicCache:
+    """Ambil instance ProfilePicCache bersama, dibuat saat pertama kali dipakai."""
+    global _profile_pic_cache
+    if _profile_pic_cache is None:
+        cache_config = config.get("profile_pic_cache", {})
+        _profile_pic_cache = ProfilePicCache(
+            cache_config.get("path", "data/profile_pics.sqlite3"),
+            max_bytes=cache_config.get("max_mb", 64) * 1024 * 1024,
+            revalidate_after=cache_config.get("revalidate_seconds", 86400),
+            touch_batch=cache_config.get("touch_batch", 20)
+        )
+        REGISTRY.register_collector(_profile_pic_cache.collect_metrics)
+    return _profile_pic_cache
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class RateGovernor:
+    """Token bucket global untuk request Instagram dengan laju adaptif.
+
+    Laju turun secara multiplikatif saat Instagram membalas 429/bad request,
+    lalu naik perlahan setiap kali request berhasil (AIMD).
+    """
+
+    def __init__(self, requests_per_minute: float = 30, burst: int = 10, min_requests_per_minute: float = 2,
+                 backoff_factor: float = 0.5, recovery_per_success: float = 1, cooldown_seconds: float = 60,
+                 sleep: Callable[[float], None] = time.sleep,
+                 async_sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        self.max_rate = requests_per_minute / 60
+        self.min_rate = min_requests_per_minute / 60
+        self.rate = self.max_rate
+        self.burst = burst
+        self.backoff_factor = backoff_factor
+        self.recovery = recovery_per_success / 60
+        self.cooldown_seconds = cooldown_seconds
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.throttles = 0
+        self.granted = 0
+        self.total_wait = 0.0
+        # Fungsi tidur bisa diganti (mis. benchmark) tanpa mengubah logika token bucket
+        self.sleep = sleep
+        self.async_sleep = async_sleep
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[dict] = None) -> "RateGovernor":
+        rate_config = (config or {}).get("rate_limit", {})
+        return cls(
+            requests_per_minute=rate_config.get("requests_per_minute", 30),
+            burst=rate_config.get("burst", 10),
+            min_requests_per_minute=rate_config.get("min_requests_per_minute", 2),
+            backoff_factor=rate_config.get("backoff_factor", 0.5),
+            recovery_per_success=rate_config.get("recovery_per_success", 1),
+            cooldown_seconds=rate_config.get("cooldown_seconds", 60)
+        )
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Ambil satu token dan kembalikan berapa detik pemanggil harus menunggu."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1  # Boleh negatif: pemanggil berikutnya mengantre di belakangnya
+            delay = max(self.blocked_until - now, -self.tokens / self.rate if self.tokens < 0 else 0.0)
+            self.granted += 1
+            self.total_wait += delay
+            return delay
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug("Rate governor delaying request by %.2f seconds", delay)
+            self.sleep(delay)
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay > 0:
+            logger.debug("Rate governor delaying request by %.2f seconds", delay)
+            await self.async_sleep(delay)
+
+    def cooldown_remaining(self) -> float:
+        """Sisa jeda setelah throttle (detik); 0 jika tidak sedang dijeda."""
+        with self._lock:
+            return max(0.0, self.blocked_until - time.monotonic())
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.recovery)
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+            self.tokens = min(self.tokens, 0.0)
+            self.blocked_until = max(self.blocked_until, now + self.cooldown_seconds)
+            self.throttles += 1
+            rate_per_minute = self.rate * 60
+        logger.warning(
+            "Instagram is throttling us, slowing down to %.1f req/min and pausing for %ss",
+            rate_per_minute, self.cooldown_seconds
+        )
+
+    def snapshot(self) -> Dict[str, float]:
+        """Kondisi governor saat ini (jatah request yang tersedia dan laju efektif)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "requests_per_minute": round(self.rate * 60, 2),
+                "max_requests_per_minute": round(self.max_rate * 60, 2),
+                "available_tokens": round(max(self.tokens, 0.0), 2),
+                "blocked_for_seconds": round(max(self.blocked_until - now, 0.0), 1),
+                "throttles": self.throttles,
+                "granted": self.granted,
+                "total_wait_seconds": round(self.total_wait, 1)
+            }
@@ -0,0 +1,148 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional
+from utils.metrics import REGISTRY
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class SchedulerBusyError(RuntimeError):
+    """Dilempar saat antrean job sudah penuh (load shedding)."""
+
+class DeadlineExceededError(Exception):
+    """Dilempar saat job melewati batas waktu end-to-end, termasuk waktu tunggu di antrean."""
+
+class FairScheduler:
+    """Penjadwal job handler: batas job bersamaan global dan per pengguna, giliran round-robin antar pengguna.
+
+    Job yang tidak langsung mendapat slot menunggu di antrean per pengguna; slot yang kosong diberikan
+    bergiliran ke pengguna berikutnya, sehingga satu pengguna tidak bisa memonopoli bot.
+    """
+
+    def __init__(self, max_concurrent: int = 8, per_user: int = 2, max_queued: int = 50,
+                 max_queued_per_user: int = 3):
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self._waiting: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        self._running: Dict[Hashable, int] = {}
+        self._active = 0
+        self.shed = 0
+        self.expired = 0
+        REGISTRY.register_collector(self.collect_metrics, loop_owned=True)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "FairScheduler":
+        scheduler_config = config.get("scheduler", {})
+        return cls(
+            max_concurrent=scheduler_config.get("max_concurrent", 8),
+            per_user=scheduler_config.get("per_user", 2),
+            max_queued=scheduler_config.get("max_queued", 50),
+            max_queued_per_user=scheduler_config.get("max_queued_per_user", 3)
+        )
+
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def collect_metrics(self):
+        yield "instbot_scheduler_running", {}, self._active
+        yield "instbot_scheduler_queued", {}, self.queued()
+        yield "instbot_scheduler_users_waiting", {}, len(self._waiting)
+        yield "instbot_scheduler_shed", {}, self.shed
+        yield "instbot_scheduler_deadline_exceeded", {}, self.expired
+
+    def _can_start(self, user_id: Hashable) -> bool:
+        return self._active < self.max_concurrent and self._running.get(user_id, 0) < self.per_user
+
+    def _grant(self, user_id: Hashable):
+        self._active += 1
+        self._running[user_id] = self._running.get(user_id, 0) + 1
+
+    def _release(self, user_id: Hashable):
+        self._active -= 1
+        self._running[user_id] -= 1
+        if not self._running[user_id]:
+            del self._running[user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        """Berikan slot kosong ke pengguna berikutnya (urutan round-robin) yang belum mencapai batasnya."""
+        while self._active < self.max_concurrent:
+            for user_id, waiters in self._waiting.items():
+                if self._running.get(user_id, 0) < self.per_user:
+                    break
+            else:
+                return
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(user_id)  # Giliran pengguna ini pindah ke belakang
+            else:
+                del self._waiting[user_id]
+            if waiter.done():
+                continue  # Sudah dibatalkan saat menunggu
+            self._grant(user_id)
+            waiter.set_result(None)
+
+    def _discard(self, user_id: Hashable, waiter: asyncio.Future):
+        waiters = self._waiting.get(user_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[user_id]
+
+    async def run(self, user_id: Hashable, job: Awaitable, deadline: Optional[float] = None) -> Any:
+        """Jalankan job milik user_id sesuai giliran; deadline (detik) dihitung sejak job diterima."""
+        loop = asyncio.get_running_loop()
+        admitted = loop.time()
+        if not self._waiting and self._can_start(user_id):
+            self._grant(user_id)
+        else:
+            if (self.queued() >= self.max_queued
+                    or len(self._waiting.get(user_id, ())) >= self.max_queued_per_user):
+                job.close()
+                self.shed += 1
+                logger.warning("Shedding job for user %s: %s jobs queued", user_id, self.queued())
+                raise SchedulerBusyError("Job queue is full")
+            waiter = loop.create_future()
+            self._waiting.setdefault(user_id, deque()).append(waiter)
+            self._dispatch()
+            try:
+                await asyncio.wait_for(waiter, deadline)
+            except BaseException as e:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(user_id)  # Slot sudah diberikan tepat saat dibatalkan
+                else:
+                    self._discard(user_id, waiter)
+                job.close()
+                if isinstance(e, asyncio.TimeoutError):
+                    self.expired += 1
+                    logger.warning("Job for user %s expired after %ss in queue", user_id, deadline)
+                    raise DeadlineExceededError(f"Job waited longer than {deadline}s") from e
+                raise
+            logger.debug("Job for user %s started after %.2fs in queue", user_id, loop.time() - admitted)
+
+        try:
+            if deadline is None:
+                return await job
+            # wait_for membatalkan job (dan unduhan/upload yang sedang berjalan) saat waktunya habis
+            return await asyncio.wait_for(job, max(0.0, deadline - (loop.time() - admitted)))
+        except asyncio.TimeoutError as e:
+            self.expired += 1
+            logger.warning("Job for user %s cancelled after exceeding its %ss deadline", user_id, deadline)
+            raise DeadlineExceededError(f"Job exceeded {deadline}s deadline") from e
+        finally:
+            self._release(user_id)
+
+_scheduler: Optional[FairScheduler] = None
+
+def get_scheduler(config: dict) -> FairScheduler:
+    """Ambil instance FairScheduler bersama, dibuat saat pertama kali dipakai."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler.from_config(config)
+        logger.info(
+            "Job scheduler ready: %s concurrent, %s per user, %s queued",
+            _scheduler.max_concurrent, _scheduler.per_user, _scheduler.max_queued
+        )
+    return _scheduler
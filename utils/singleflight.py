@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class SingleFlight:
+    """Gabungkan permintaan async identik yang sedang berjalan agar hanya dieksekusi sekali."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug("Joining in-flight request %s", key)
+        else:
+            self.leaders += 1
+            # Dijalankan sebagai task terpisah agar pembatalan satu pemanggil tidak membatalkan yang lain
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # Tandai sudah dibaca walau semua pemanggil sudah batal
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
@@ -0,0 +1,107 @@
+from abc import ABC, abstractmethod
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from utils.cache import TTLCache
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+class StateStore(ABC):
+    """Penyimpanan state percakapan per pengguna (profil aktif, halaman highlight, dll)."""
+
+    @abstractmethod
+    def get(self, user_id: int) -> dict:
+        ...
+
+    @abstractmethod
+    def set(self, user_id: int, state: dict):
+        ...
+
+    @abstractmethod
+    def delete(self, user_id: int):
+        ...
+
+    def update(self, user_id: int, **changes) -> dict:
+        state = self.get(user_id)
+        state.update(changes)
+        self.set(user_id, state)
+        return state
+
+class MemoryStateStore(StateStore):
+    """State di memori proses; hilang saat restart dan tidak dibagi antar replika."""
+
+    def __init__(self, ttl: float = 86400, max_size: int = 10000):
+        self._cache = TTLCache("state", max_size=max_size, ttl=ttl)
+
+    def get(self, user_id: int) -> dict:
+        return dict(self._cache.get(user_id) or {})
+
+    def set(self, user_id: int, state: dict):
+        self._cache.set(user_id, dict(state))
+
+    def delete(self, user_id: int):
+        self._cache.pop(user_id)
+
+class SQLiteStateStore(StateStore):
+    """State di file SQLite; bertahan setelah restart dan bisa dibagi beberapa proses bot."""
+
+    def __init__(self, path: str, ttl: float = 86400):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Aman dibaca/ditulis beberapa proses
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_state ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        logger.info("Conversation state store opened at %s", path)
+
+    def get(self, user_id: int) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM conversation_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None or (self.ttl and row[1] + self.ttl < time.time()):
+            return {}
+        return json.loads(row[0])
+
+    def set(self, user_id: int, state: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversation_state (user_id, data, updated_at) VALUES (?, ?, ?)",
+                (user_id, json.dumps(state), time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, user_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM conversation_state WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+_state_store: Optional[StateStore] = None
+
+def create_state_store(config: dict) -> StateStore:
+    state_config = config.get("state", {})
+    backend = state_config.get("backend", "sqlite")
+    ttl = state_config.get("ttl", 86400)
+    if backend == "memory":
+        return MemoryStateStore(ttl=ttl, max_size=state_config.get("max_size", 10000))
+    if backend == "sqlite":
+        return SQLiteStateStore(state_config.get("path", "data/state.sqlite3"), ttl=ttl)
+    raise ValueError(f"Unknown state backend: {backend}")
+
+def get_state_store(config: dict) -> StateStore:
+    """Ambil instance StateStore bersama, dibuat saat pertama kali dipakai."""
+    global _state_store
+    if _state_store is None:
+        _state_store = create_state_store(config)
+    return _state_store
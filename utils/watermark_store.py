@@ -0,0 +1,79 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+Watermark = Tuple[float, int]  # (date_utc sebagai timestamp, mediaid)
+
+def watermark_key(item) -> Watermark:
+    """Urutan total story item: waktu unggah, lalu mediaid untuk item dengan waktu yang sama."""
+    return item.date_utc.replace(tzinfo=datetime.timezone.utc).timestamp(), int(item.mediaid)
+
+class WatermarkStore:
+    """Story terakhir yang sudah terkirim per (pengguna, profil); satu baris ringkas per pasangan."""
+
+    def __init__(self, path: str, ttl: float = 172800):
+        self.path = path
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS story_watermarks ("
+            "user_id INTEGER NOT NULL, profile_id INTEGER NOT NULL, taken_at REAL NOT NULL, "
+            "media_id INTEGER NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (user_id, profile_id))"
+        )
+        self._conn.commit()
+        logger.info("Story watermark store opened at %s", path)
+
+    def get(self, user_id: int, profile_id: int) -> Optional[Watermark]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT taken_at, media_id FROM story_watermarks "
+                "WHERE user_id = ? AND profile_id = ? AND updated_at >= ?",
+                (user_id, profile_id, time.time() - self.ttl if self.ttl else 0)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def advance(self, user_id: int, profile_id: int, items: Iterable):
+        """Majukan watermark ke item terbaru yang terkirim; tidak pernah mundur."""
+        keys = [watermark_key(item) for item in items]
+        if not keys:
+            return
+        newest = max(keys)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT taken_at, media_id FROM story_watermarks WHERE user_id = ? AND profile_id = ?",
+                (user_id, profile_id)
+            ).fetchone()
+            if row is not None and (row[0], row[1]) > newest:
+                newest = (row[0], row[1])
+            self._conn.execute(
+                "INSERT OR REPLACE INTO story_watermarks (user_id, profile_id, taken_at, media_id, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, profile_id, newest[0], newest[1], time.time())
+            )
+            if self.ttl:
+                self._conn.execute("DELETE FROM story_watermarks WHERE updated_at < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+_watermark_store: Optional[WatermarkStore] = None
+
+def get_watermark_store(config: dict) -> WatermarkStore:
+    """Ambil instance WatermarkStore bersama, dibuat saat pertama kali dipakai."""
+    global _watermark_store
+    if _watermark_store is None:
+        watermark_config = config.get("watermarks", {})
+        _watermark_store = WatermarkStore(
+            watermark_config.get("path", "data/watermarks.sqlite3"),
+            ttl=watermark_config.get("ttl", 172800)
+        )
+    return _watermark_store
@@ -0,0 +1,179 @@
+import asyncio
+import copy
+import hmac
+import json
+import multiprocessing
+import os
+import queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from telegram import Bot, Update
+from telegram.ext import Application
+from utils.logging_utils import setup_logging
+
+logger = setup_logging()
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+UPDATE_KINDS = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "channel_post", "edited_channel_post"
+)
+
+def webhook_secret(config: dict) -> Optional[str]:
+    """Secret token webhook; variabel env WEBHOOK_SECRET_TOKEN diutamakan daripada config."""
+    return os.getenv("WEBHOOK_SECRET_TOKEN") or config.get("webhook", {}).get("secret_token") or None
+
+def worker_config(config: dict) -> dict:
+    """Config untuk satu proses worker webhook.
+
+    Setiap worker punya RateGovernor sendiri, jadi batas laju dibagi rata agar totalnya tetap
+    sesuai rate_limit. Worker hanya memuat file sesi yang sudah disiapkan proses induk.
+    """
+    workers = max(1, config.get("webhook", {}).get("workers", 2))
+    result = copy.deepcopy(config)
+    rate_config = result.setdefault("rate_limit", {})
+    rate_config["requests_per_minute"] = rate_config.get("requests_per_minute", 30) / workers
+    rate_config["min_requests_per_minute"] = rate_config.get("min_requests_per_minute", 2) / workers
+    rate_config["burst"] = max(1, rate_config.get("burst", 10) // workers)
+    result.setdefault("startup", {})["defer_login"] = True
+    return result
+
+def routing_key(data: dict) -> int:
+    """Ambil id pengguna/chat dari update agar satu pengguna selalu ditangani worker yang sama."""
+    for kind in UPDATE_KINDS:
+        payload = data.get(kind)
+        if not payload:
+            continue
+        sender = payload.get("from") or payload.get("chat") or {}
+        if "id" in sender:
+            return int(sender["id"])
+    return int(data.get("update_id", 0))
+
+class WebhookDispatcher:
+    """Penerima webhook HTTP yang membagi update ke beberapa proses worker."""
+
+    def __init__(self, config: dict, worker_target: Callable, worker_args: tuple = ()):
+        webhook_config = config.get("webhook", {})
+        self.listen = webhook_config.get("listen", "0.0.0.0")
+        self.port = webhook_config.get("port", 8443)
+        self.path = webhook_config.get("path", "/telegram")
+        self.secret_token = webhook_secret(config)
+        if not self.secret_token:
+            # Tanpa secret siapa pun yang tahu URL bisa mengirim update palsu
+            raise ValueError("Webhook mode requires WEBHOOK_SECRET_TOKEN (or webhook.secret_token)")
+        self.worker_count = max(1, webhook_config.get("workers", 2))
+        self.queue_size = webhook_config.get("queue_size", 1000)
+        self.worker_target = worker_target
+        self.worker_args = worker_args
+        self.queues: List[multiprocessing.Queue] = []
+        self.workers: List[multiprocessing.Process] = []
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def start_workers(self):
+        for index in range(self.worker_count):
+            update_queue = multiprocessing.Queue(maxsize=self.queue_size)
+            process = multiprocessing.Process(
+                target=self.worker_target,
+                args=(index, update_queue) + self.worker_args,
+                name=f"bot-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self.queues.append(update_queue)
+            self.workers.append(process)
+        logger.info("Started %s webhook workers", self.worker_count)
+
+    def dispatch(self, data: dict) -> bool:
+        """Masukkan update ke antrean worker; False jika antrean penuh."""
+        index = routing_key(data) % len(self.queues)
+        try:
+            self.queues[index].put_nowait(data)
+            return True
+        except queue.Full:
+            logger.warning("Worker %s queue full, asking Telegram to retry update %s", index, data.get('update_id'))
+            return False
+
+    def _make_handler(self):
+        dispatcher = self
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != dispatcher.path:
+                    self.send_error(404)
+                    return
+                if not hmac.compare_digest(
+                    self.headers.get(SECRET_HEADER, ""), dispatcher.secret_token
+                ):
+                    logger.warning("Rejected webhook call with invalid secret token")
+                    self.send_error(403)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    data = json.loads(self.rfile.read(length))
+                except (ValueError, json.JSONDecodeError):
+                    self.send_error(400)
+                    return
+                # 503 membuat Telegram mengirim ulang update nanti (back-pressure)
+                self.send_response(200 if dispatcher.dispatch(data) else 503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug("Webhook request: %s", format % args)
+
+        return WebhookHandler
+
+    def serve_forever(self):
+        self.start_workers()
+        self.server = ThreadingHTTPServer((self.listen, self.port), self._make_handler())
+        logger.info("Webhook receiver listening on %s:%s%s", self.listen, self.server.server_address[1], self.path)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.server_close()
+        for update_queue in self.queues:
+            try:
+                update_queue.put_nowait(None)
+            except queue.Full:
+                pass
+        for process in self.workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        logger.info("Webhook workers stopped")
+
+async def register_webhook(token: str, config: dict, base_url: Optional[str] = None):
+    """Daftarkan URL publik webhook ke Telegram."""
+    webhook_config = config.get("webhook", {})
+    public_url = webhook_config.get("public_url")
+    if not public_url:
+        logger.warning("webhook.public_url is empty, skipping setWebhook")
+        return
+    bot = Bot(token, base_url=base_url) if base_url else Bot(token)
+    async with bot:
+        await bot.set_webhook(
+            url=public_url.rstrip("/") + webhook_config.get("path", "/telegram"),
+            secret_token=webhook_secret(config),
+            max_connections=webhook_config.get("max_connections", 40),
+            allowed_updates=Update.ALL_TYPES
+        )
+    logger.info("Webhook registered at %s", public_url)
+
+async def process_updates(application: Application, update_queue: multiprocessing.Queue):
+    """Loop worker: ambil update mentah dari antrean dan serahkan ke Application."""
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        logger.info("Webhook worker ready")
+        try:
+            while True:
+                data = await loop.run_in_executor(None, update_queue.get)
+                if data is None:
+                    break
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        finally:
+            await application.stop()